@@ -7,6 +7,7 @@ Copyright 2017-2019 Dima Pustakhod
 DEBUG = False
 HAS_KLAYOUT = False
 HAS_PYA = False
+HAS_NUMPY = False
 
 try:
     if DEBUG:
@@ -21,8 +22,10 @@ try:
     from klayout.db import (
         Edges,
         LayerInfo,
+        Layout,
         Point,
         Polygon,
+        RecursiveShapeIterator,
         Region,
         SimplePolygon,
         Trans,
@@ -45,9 +48,11 @@ except:
             Edges,
             FileDialog,
             LayerInfo,
+            Layout,
             MessageBox,
             Point,
             Polygon,
+            RecursiveShapeIterator,
             Region,
             SimplePolygon,
             Trans,
@@ -64,6 +69,14 @@ except:
             "installed in the current python distribution."
         )
 
+try:
+    # optional, used to vectorize XSectionGenerator.mask()
+    import numpy
+
+    HAS_NUMPY = True
+except ImportError:
+    pass
+
 
 # from .misc import info
 # reload(pyxs.misc)
@@ -0,0 +1,11 @@
+"""klayout_pyxs.__main__.py
+
+Batch entry point, see klayout_pyxs.batch.
+
+"""
+import sys
+
+from klayout_pyxs.batch import main
+
+if __name__ == "__main__":
+    sys.exit(main())
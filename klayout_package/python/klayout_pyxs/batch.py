@@ -0,0 +1,400 @@
+"""klayout_pyxs.batch.py
+
+Run a .pyxs script on many cuts of many layouts without the KLayout GUI,
+spreading the cuts over a pool of worker processes.
+
+Usage::
+
+    $ python -m klayout_pyxs cmos.pyxs chip1.gds chip2.oas --cuts cuts.csv
+
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from klayout_pyxs import DPoint, Layout
+from klayout_pyxs.layer_cache import LayerCache, layout_index
+from klayout_pyxs.pyxs_lib import XSectionGenerator
+
+# path -> ((mtime, size), Layout) of the layouts already read by the
+# current (worker) process
+_layouts = {}
+
+
+def parse_cut(cut):
+    """Parse a cut given as "x1,y1;x2,y2" (in micron).
+
+    Examples
+    --------
+    >>> parse_cut('-1,0;1,0.5')
+    ((-1.0, 0.0), (1.0, 0.5))
+    """
+    p1, p2 = cut.split(";")
+    x1, y1 = p1.split(",")
+    x2, y2 = p2.split(",")
+    return (float(x1), float(y1)), (float(x2), float(y2))
+
+
+def read_cuts(file_name):
+    """Read a list of cuts from a CSV or JSON file.
+
+    A CSV file must have a header with the columns x1, y1, x2, y2 and,
+    optionally, name. A JSON file must contain a list of objects with
+    "p1", "p2" ([x, y] in micron) and, optionally, "name" keys.
+
+    Parameters
+    ----------
+    file_name : str
+
+    Returns
+    -------
+    cuts : list of tuple
+        (p1, p2, name) for each cut. p1 and p2 are (x, y) tuples in
+        micron, name is None if not given.
+    """
+    cuts = []
+    with open(file_name) as file:
+        if os.path.splitext(file_name)[1].lower() == ".json":
+            for c in json.load(file):
+                p1 = tuple(float(v) for v in c["p1"])
+                p2 = tuple(float(v) for v in c["p2"])
+                cuts.append((p1, p2, c.get("name") or None))
+        else:
+            for row in csv.DictReader(file):
+                p1 = float(row["x1"]), float(row["y1"])
+                p2 = float(row["x2"]), float(row["y2"])
+                cuts.append((p1, p2, row.get("name") or None))
+    return cuts
+
+
+def output_file_name(stem, i, name, fmt):
+    """Return the name of the output file of a cut.
+
+    The index of the cut makes the name unique, also for cuts with the
+    same name. Path separators and other characters not allowed in file
+    names are replaced by "_".
+
+    Examples
+    --------
+    >>> output_file_name('sample', 3, 'M1/VIA', 'gds')
+    'sample_cut3_M1_VIA.gds'
+    >>> output_file_name('sample', 0, None, 'oas')
+    'sample_cut0.oas'
+    """
+    if name:
+        name = re.sub(r'[\\/:*?"<>|\s]+', "_", name)
+        return f"{stem}_cut{i}_{name}.{fmt}"
+    return f"{stem}_cut{i}.{fmt}"
+
+
+def _get_layout(file_name):
+    """Read a layout file once per process.
+
+    The layout is read again if the file has changed since, and replaces
+    the previous version in the cache.
+    """
+    path = os.path.abspath(file_name)
+    st = os.stat(path)
+    version = (st.st_mtime_ns, st.st_size)
+
+    cached = _layouts.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    layout = Layout()
+    layout.read(path)
+    _layouts[path] = (version, layout)
+    return layout
+
+
+def run_cut(
+    script, layout_file, p1, p2, name, output_file, cell=None, layer_cache=None
+):
+    """Generate a single cross-section and write it to a file.
+
+    This function is executed in the worker processes.
+
+    Parameters
+    ----------
+    script : str
+        path to the .pyxs script
+    layout_file : str
+        path to the source layout
+    p1 : tuple of float
+        first point of the ruler, in micron
+    p2 : tuple of float
+        second point of the ruler, in micron
+    name : str or None
+        name of the cut, used to name the cross-section cell
+    output_file : str
+        path to the output layout
+    cell : str (optional)
+        name of the source cell. Top cell by default.
+    layer_cache : LayerCache (optional)
+        layer shapes shared with other cuts of the same layout
+
+    Returns
+    -------
+    output_file : str
+    layers_file : str or None
+        .lyp file requested by the script with layers_file()
+    """
+    layout = _get_layout(layout_file)
+    xs = XSectionGenerator(script)
+    target_layout = xs.run_headless(
+        layout,
+        DPoint(*p1),
+        DPoint(*p2),
+        cell=cell,
+        ruler_text=name,
+        layer_cache=layer_cache,
+    )
+    target_layout.write(output_file)
+    return output_file, xs._lyp_file
+
+
+def run_cuts(
+    script, layout_file, cuts, cell=None, layer_cache=False, layer_index=False
+):
+    """Generate the cross-sections of several cuts of one layout.
+
+    This function is executed in the worker processes.
+
+    Parameters
+    ----------
+    script : str
+        path to the .pyxs script
+    layout_file : str
+        path to the source layout
+    cuts : list of tuple
+        (p1, p2, name, output_file) for each cut, see run_cut()
+    cell : str (optional)
+        name of the source cell. Top cell by default.
+    layer_cache : bool (optional)
+        if True, each layer is loaded once for all the cuts
+    layer_index : bool (optional)
+        if True, the layers are flattened once per process into a spatial
+        index, which is queried by all the cuts (see layout_index()).
+        Takes precedence over layer_cache.
+
+    Returns
+    -------
+    results : list of tuple
+        (output_file, layers_file, error) for each cut
+    """
+    cache = None
+    try:
+        if layer_cache or layer_index:
+            layout = _get_layout(layout_file)
+            if cell is None:
+                cell_index = layout.top_cell().cell_index()
+            elif layout.has_cell(cell):
+                cell_index = layout.cell(cell).cell_index()
+            else:
+                # same error as XSectionGenerator.run_headless()
+                raise ValueError(f"'run_headless()': no cell named '{cell}'")
+            if layer_index:
+                cache = layout_index(layout, cell_index)
+            else:
+                cache = LayerCache.for_cuts(layout, cell_index, [c[:2] for c in cuts])
+    except Exception as e:
+        # all the cuts of the layout fail
+        return [(c[3], None, e) for c in cuts]
+
+    results = []
+    for p1, p2, name, output_file in cuts:
+        try:
+            results.append(
+                run_cut(script, layout_file, p1, p2, name, output_file, cell, cache)
+                + (None,)
+            )
+        except Exception as e:
+            results.append((output_file, None, e))
+    return results
+
+
+def run_batch(
+    script,
+    layout_files,
+    cuts,
+    output_dir,
+    cell=None,
+    max_workers=None,
+    fmt="gds",
+    mp_context=None,
+    layer_cache=False,
+    layer_index=False,
+):
+    """Generate the cross-sections of all cuts for all layouts.
+
+    Parameters
+    ----------
+    script : str
+        path to the .pyxs script
+    layout_files : list of str
+        paths to the source layouts
+    cuts : list of tuple
+        (p1, p2, name) for each cut, see read_cuts()
+    output_dir : str
+        folder for the output layouts. One file is written per layout
+        and cut, see output_file_name().
+    cell : str (optional)
+        name of the source cell. Top cell by default.
+    max_workers : int (optional)
+        number of worker processes. All cores are used by default. With
+        max_workers=1 the cuts are processed in the current process.
+    fmt : str (optional)
+        'gds|oas'. Output file format.
+    mp_context : multiprocessing context (optional)
+        context used to start the worker processes
+    layer_cache : bool (optional)
+        if True, the cuts of each layout are split into one chunk per
+        worker, and each layer is loaded once per chunk for the bounding
+        box of all its cuts (see LayerCache). Best suited for cuts close
+        to each other.
+    layer_index : bool (optional)
+        if True, each worker process flattens the used layers of each
+        layout once into a spatial index shared by all its cuts (see
+        layout_index()). Best suited for many cuts spread over a large
+        layout.
+
+    Returns
+    -------
+    results : list of tuple
+        (output_file, layers_file, error) for each layout and cut. error
+        is None on success, an exception instance otherwise.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    n_workers = max_workers or os.cpu_count() or 1
+
+    jobs = []  # (layout_file, cuts) processed by a single worker call
+    for layout_file in layout_files:
+        stem = os.path.splitext(os.path.basename(layout_file))[0]
+        layout_cuts = []
+        for i, (p1, p2, name) in enumerate(cuts):
+            output_file = os.path.join(output_dir, output_file_name(stem, i, name, fmt))
+            layout_cuts.append((p1, p2, name, output_file))
+
+        if layer_cache and not layer_index:
+            size = -(-len(layout_cuts) // n_workers)  # ceil
+            for k in range(0, len(layout_cuts), size):
+                jobs.append((layout_file, layout_cuts[k : k + size]))
+        else:
+            jobs += [(layout_file, [c]) for c in layout_cuts]
+
+    results = []
+    if n_workers == 1:
+        for layout_file, job_cuts in jobs:
+            results += run_cuts(
+                script, layout_file, job_cuts, cell, layer_cache, layer_index
+            )
+        return results
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=mp_context
+    ) as executor:
+        futures = [
+            executor.submit(
+                run_cuts, script, layout_file, job_cuts, cell, layer_cache, layer_index
+            )
+            for layout_file, job_cuts in jobs
+        ]
+        for (_, job_cuts), future in zip(jobs, futures):
+            try:
+                results += future.result()
+            except Exception as e:
+                results += [(c[3], None, e) for c in job_cuts]
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m klayout_pyxs",
+        description="Generate cross-sections of layouts with a .pyxs script "
+        "without the KLayout GUI.",
+    )
+    parser.add_argument("script", help="the .pyxs script")
+    parser.add_argument("layouts", nargs="+", help="GDS / OASIS layout files")
+    parser.add_argument(
+        "--cuts", help="CSV (x1,y1,x2,y2,name) or JSON (p1,p2,name) cut list"
+    )
+    parser.add_argument(
+        "--cut",
+        action="append",
+        default=[],
+        metavar="X1,Y1;X2,Y2",
+        help="a single cut in micron. Can be given multiple times.",
+    )
+    parser.add_argument("--cell", help="source cell name (default: top cell)")
+    parser.add_argument(
+        "-o", "--output-dir", default=".", help="output folder (default: .)"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="number of worker processes (default: all cores)"
+    )
+    parser.add_argument(
+        "--format", choices=("gds", "oas"), default="gds", help="output file format"
+    )
+    parser.add_argument(
+        "--layer-cache",
+        action="store_true",
+        help="load each layer once per worker for all its cuts",
+    )
+    parser.add_argument(
+        "--layer-index",
+        action="store_true",
+        help="flatten each layer once per worker into a spatial index "
+        "queried by all cuts",
+    )
+    parser.add_argument(
+        "--report",
+        metavar="FILE",
+        help="write the output file, layer properties file and error of each "
+        "cut to a JSON file",
+    )
+    args = parser.parse_args(argv)
+
+    cuts = read_cuts(args.cuts) if args.cuts else []
+    cuts += [parse_cut(c) + (None,) for c in args.cut]
+    if not cuts:
+        parser.error("no cuts given, use --cuts or --cut")
+
+    results = run_batch(
+        args.script,
+        args.layouts,
+        cuts,
+        args.output_dir,
+        cell=args.cell,
+        max_workers=args.jobs,
+        fmt=args.format,
+        layer_cache=args.layer_cache,
+        layer_index=args.layer_index,
+    )
+
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(
+                [
+                    {
+                        "output_file": output_file,
+                        "layers_file": layers_file,
+                        "error": None if error is None else str(error),
+                    }
+                    for output_file, layers_file, error in results
+                ],
+                file,
+                indent=1,
+            )
+
+    n_failed = 0
+    for output_file, _, error in results:
+        if error is None:
+            print(f"Written {output_file}")
+        else:
+            n_failed += 1
+            print(f"Failed {output_file}: {error}", file=sys.stderr)
+    return 1 if n_failed else 0
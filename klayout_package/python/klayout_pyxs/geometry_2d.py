@@ -2,22 +2,30 @@
 
 (C) 2017-2019 Dima Pustakhod and contributors
 """
+import functools
+import itertools
 import math
 
 from klayout_pyxs import (
     EP_,
+    HAS_NUMPY,
     DPoint,
     Edges,
     Point,
     Polygon,
+    RecursiveShapeIterator,
     Region,
     SimplePolygon,
     Trans,
 )
 from klayout_pyxs.compat import range
-from klayout_pyxs.layer_parameters import string_to_layer_info
+from klayout_pyxs.layer_parameters import find_layer_index
+from klayout_pyxs.surface_2d import air_profile, grow_profile
 from klayout_pyxs.utils import info, int_floor, make_iterable, print_info
 
+if HAS_NUMPY:
+    import numpy as np
+
 
 class EdgeProcessor(EP_):
     """
@@ -211,16 +219,320 @@ def parse_grow_etch_args(
     return into, through, on, mode
 
 
+@functools.lru_cache(maxsize=256)
+def kernel_polygon(mode, xyi, zi, n=0):
+    """Return the kernel of a grow or etch operation.
+
+    Kernels are cached, as scripts repeat the same grow and etch
+    dimensions many times. The returned polygon is shared and must not
+    be modified.
+
+    Parameters
+    ----------
+    mode : str
+        'taper|round|square'. "taper" is a diamond, "round" a polygon
+        with n points approximating an ellipse, "square" a box.
+    xyi : int
+        lateral half size, in dbu
+    zi : int
+        vertical half size, in dbu
+    n : int (optional)
+        number of points in "round" mode
+
+    Returns
+    -------
+    kp : Polygon or SimplePolygon
+    """
+    if mode == "taper":
+        return Polygon([Point(-xyi, 0), Point(0, zi), Point(xyi, 0), Point(0, -zi)])
+
+    if mode == "round":
+        da = 2.0 * math.pi / n
+        rf = 1.0 / math.cos(da * 0.5)
+        info(f"    n = {n}, da = {da}, rf = {rf}")
+        kernel_pts = [
+            Point.from_dpoint(
+                DPoint(
+                    xyi * rf * math.cos(da * (i + 0.5)),
+                    zi * rf * math.sin(da * (i + 0.5)),
+                )
+            )
+            for i in range(n)
+        ]
+        return Polygon(kernel_pts)
+
+    kernel_pts = [Point(-xyi, -zi), Point(-xyi, zi), Point(xyi, zi), Point(xyi, -zi)]
+    kp = SimplePolygon()
+    kp.set_points(kernel_pts, True)  # "raw" - don't optimize away
+    return kp
+
+
+def round_kernel_points(r, tolerance=None):
+    """Return the number of points of a round kernel.
+
+    The kernel polygon circumscribes the ellipse, so its largest deviation
+    from the ellipse is r * (1 / cos(pi / n) - 1) at the vertices.
+
+    Parameters
+    ----------
+    r : int
+        largest half axis of the kernel, in dbu
+    tolerance : int (optional)
+        maximum deviation from the ellipse, in dbu. If None, 64 points are
+        used.
+
+    Returns
+    -------
+    n : int
+        a multiple of 4 between 8 and 64
+
+    Examples
+    --------
+    >>> round_kernel_points(20, 3)
+    8
+    >>> round_kernel_points(20, 1)
+    12
+    """
+    if tolerance is None or tolerance <= 0:
+        return 64
+    n = math.ceil(math.pi / math.acos(r / (r + tolerance)))
+    return min(64, max(8, -(-n // 4) * 4))
+
+
+MERGE_STRATEGIES = ("fixed", "tree", "final")
+
+
+def merge_sums(sums, strategy="fixed", merge_every=10, region=None):
+    """Merge the Minkowski sums of a grow or etch operation.
+
+    Merging snaps the intersection points to the grid, so the result
+    depends slightly on the strategy.
+
+    Parameters
+    ----------
+    sums : list of Polygon
+    strategy : str
+        'fixed|tree|final'. "fixed" merges after the first merge_every + 1
+        sums and then every merge_every sums, the historical schedule.
+        "tree" merges groups of merge_every sums and then the groups
+        pairwise, "final" merges all sums at once.
+    merge_every : int
+        number of sums merged together by the "fixed" and "tree"
+        strategies
+    region : Region (optional)
+        more shapes merged with the sums. The region is merged in place.
+
+    Returns
+    -------
+    d : Region
+        merged region
+    """
+    if strategy not in MERGE_STRATEGIES:
+        raise ValueError(
+            f"unknown merge strategy {strategy!r}, "
+            f"must be one of {', '.join(MERGE_STRATEGIES)}"
+        )
+
+    d = Region() if region is None else region
+    if not sums:
+        d.merge()
+        return d
+
+    if strategy == "fixed":
+        first = merge_every + 1
+        d.insert(sums[:first])
+        for k in range(first, len(sums), merge_every):
+            d.merge()
+            d.insert(sums[k : k + merge_every])
+
+    elif strategy == "tree":
+        regions = [] if d.is_empty() else [d.merged()]
+        for k in range(0, len(sums), merge_every):
+            r = Region()
+            r.insert(sums[k : k + merge_every])
+            regions.append(r.merged())
+        while len(regions) > 1:
+            pairs = zip(regions[0::2], regions[1::2])
+            merged = [(a + b).merged() for a, b in pairs]
+            regions = merged + regions[len(merged) * 2 :]
+        return regions[0]
+
+    else:
+        d.insert(sums)
+
+    d.merge()
+    return d
+
+
+def _pack_edges(polygons):
+    """Pack the edges of polygons into arrays of start and end points.
+
+    Parameters
+    ----------
+    polygons : list of Polygon
+
+    Returns
+    -------
+    p1, p2 : numpy.ndarray
+        (n, 2) int64 arrays of the start and end points of the edges, in
+        the order of Polygon.each_edge()
+    """
+    xy = []  # x0, y0, x1, y1, ...
+    n_pts = []
+    for polygon in polygons:
+        if polygon.is_box():
+            # hulls are clockwise
+            b = polygon.bbox()
+            l, bt, r, t = b.left, b.bottom, b.right, b.top
+            xy += (l, bt, l, t, r, t, r, bt)
+            n_pts.append(4)
+            continue
+        contours = [polygon.each_point_hull()]
+        contours += [polygon.each_point_hole(h) for h in range(polygon.holes())]
+        for contour in contours:
+            n = len(xy)
+            for p in contour:
+                xy += (p.x, p.y)
+            n_pts.append((len(xy) - n) // 2)
+
+    # edges go from each point to the next one of the same contour
+    p1 = np.array(xy, dtype=np.int64).reshape(-1, 2)
+    n_pts = np.array(n_pts, dtype=np.int64)
+    ends = np.cumsum(n_pts) - 1
+    nxt = np.arange(1, len(p1) + 1)
+    nxt[ends] = ends - n_pts + 1
+    return p1, p1[nxt]
+
+
+def sweep_crossing_points(polygons, lines, extend):
+    """Compute where the edges of polygons cross a set of rulers.
+
+    This is the vectorized equivalent of the crossing point loop of
+    XSectionGenerator.mask(), for many rulers at once. The rulers are
+    grouped by direction. Within a group, each ruler is identified by its
+    offset along the normal, so the rulers crossed by an edge form a
+    range of the sorted offsets and are found by a binary search, like
+    in a scanline sweep. The crossing positions are then computed for all
+    (edge, ruler) pairs in one go, with the same floating point operations
+    as mask(), so the results are identical.
+
+    Requires numpy.
+
+    Parameters
+    ----------
+    polygons : list of Polygon
+        in dbu
+    lines : list of Edge
+        rulers, in dbu
+    extend : int
+        extension of the rulers, in dbu. Crossing points are clamped to
+        [-extend, length + extend].
+
+    Returns
+    -------
+    crossing_points : list of list
+        for each ruler, the [z, s] crossing points sorted by z, where z is
+        the position along the ruler in dbu and s the sum of the
+        orientations of the edges crossing the ruler at z (+1: "enter
+        geometry", -1: "leave geometry")
+    """
+    results = [[] for _ in lines]
+    if not len(polygons):
+        return results
+    p1, p2 = _pack_edges(polygons)
+
+    families = {}  # reduced direction -> indices of the rulers
+    for k, line in enumerate(lines):
+        if not line.is_degenerate():
+            g = math.gcd(line.dx(), line.dy())
+            families.setdefault((line.dx() // g, line.dy() // g), []).append(k)
+
+    rulers = np.array(
+        [(ln.p1.x, ln.p1.y, ln.p2.x, ln.p2.y, ln.length()) for ln in lines],
+        dtype=np.int64,
+    ).reshape(-1, 5)
+
+    for (ux, uy), ks in families.items():
+        ks = np.array(ks)
+        # offsets of the edge points and of the rulers along the normal
+        w1 = ux * p1[:, 1] - uy * p1[:, 0]
+        w2 = ux * p2[:, 1] - uy * p2[:, 0]
+        c = np.array([ux * lines[k].p1.y - uy * lines[k].p1.x for k in ks])
+        order = np.argsort(c, kind="stable")
+
+        # an edge crosses a ruler (crossed_by() and side_of() > 0 of either
+        # end point) if the ruler offset is in [min(w1, w2), max(w1, w2))
+        lo = np.searchsorted(c[order], np.minimum(w1, w2), "left")
+        hi = np.searchsorted(c[order], np.maximum(w1, w2), "left")
+        n = hi - lo
+        if not n.sum():
+            continue
+        ei = np.repeat(np.arange(len(p1)), n)
+        li = ks[order[np.repeat(lo - np.cumsum(n) + n, n) + np.arange(n.sum())]]
+
+        lx1, ly1, lx2, ly2, length = rulers[li].T
+        ldx, ldy = lx2 - lx1, ly2 - ly1
+        e1, e2 = p1[ei], p2[ei]
+
+        edx = (e2[:, 0] - e1[:, 0]).astype(float)
+        edy = (e2[:, 1] - e1[:, 1]).astype(float)
+        z = (edx * (e1[:, 1] - ly1) - edy * (e1[:, 0] - lx1)) / (edx * ldy - edy * ldx)
+        z = np.floor(z * length + 0.5)
+        z = np.clip(z, -extend, length + extend).astype(np.int64)
+        s = np.sign(edy * ldx - edx * ldy).astype(np.int64)
+
+        # compress the crossing points of each ruler at the same position
+        idx = np.lexsort((z, li))
+        li, z, s = li[idx], z[idx], s[idx]
+        first = np.ones(len(z), dtype=bool)
+        first[1:] = (li[1:] != li[:-1]) | (z[1:] != z[:-1])
+        starts = np.flatnonzero(first)
+        li, z, s = li[starts], z[starts], np.add.reduceat(s, starts)
+        keep = s != 0
+        # like mask(), which drops a last crossing point at z = 0
+        last = np.ones(len(z), dtype=bool)
+        last[:-1] = li[1:] != li[:-1]
+        keep &= ~(last & (z == 0))
+
+        for k, zi, si in zip(li[keep].tolist(), z[keep].tolist(), s[keep].tolist()):
+            results[k].append([zi, si])
+    return results
+
+
+def _to_region(polygons):
+    """Return a Region of a list of polygons (or the Region itself)"""
+    if isinstance(polygons, Region):
+        return polygons
+    region = Region()
+    if polygons:
+        region.insert(polygons)
+    return region
+
+
+# version numbers of the layout data, see LayoutData.version
+_versions = itertools.count(1)
+
+
 class LayoutData:
     """Class to manipulate masks, which is a 2d view.
 
-    Layout data is a list of polygons.
+    Layout data is a list of polygons. With
+    XSectionGenerator.region_storage(True), the results of the boolean
+    and sizing operations are kept as a Region instead, and converted to
+    a list only when the polygons are read.
+
+    The polygons are copy-on-write: dup() shares them with the copy, and
+    every operation modifying the layout data assigns new polygons
+    instead of changing the shared ones. Each assignment gets a new
+    version number, see version, which caches can use to tell if the
+    polygons have changed.
 
     Attributes
     ----------
     self._polygons : list of Polygon
         In case of XSectionGenerator.layer() object, self._polygons
-        contains shapes touching the ruler, top view of the mask
+        contains shapes touching the ruler, top view of the mask.
+        Shared, must not be modified in place.
     """
 
     def __init__(self, polygons, xs):
@@ -228,7 +540,7 @@ class LayoutData:
 
         Parameters
         ----------
-        polygons : list of Polygon
+        polygons : list of Polygon or Region
             list of shapes contained in this LayoutData
         xs : XSectionGenerator
 
@@ -237,11 +549,63 @@ class LayoutData:
         self._xs = xs
         self._ep = ep
 
+    @property
+    def _polygons(self):
+        if self._list is None:
+            self._list = list(self._region.each())
+        return self._list
+
+    @_polygons.setter
+    def _polygons(self, polygons):
+        if isinstance(polygons, Region):
+            self._list, self._region = None, polygons
+        else:
+            self._list, self._region = polygons, None
+        self._version = next(_versions)
+
+    @property
+    def version(self):
+        """
+        Return
+        ------
+        version : int
+            number of the polygons of this layout data. It increases with
+            every modification, and is unique across all layout data
+            except for copies made by dup(), which share it until one of
+            them is modified.
+        """
+        return self._version
+
+    @property
+    def _region_storage(self):
+        # the 3D generator has no region storage
+        return getattr(self._xs, "region_storage_enabled", False)
+
+    @property
+    def _storage(self):
+        """The polygons as stored, a list of Polygon or a Region"""
+        return self._list if self._list is not None else self._region
+
+    @property
+    def region(self):
+        """
+        Return
+        ------
+        region : Region
+            polygons which constitute the mask. Shared, must not be
+            modified.
+        """
+        if self._region is None:
+            self._region = _to_region(self._list)
+        return self._region
+
     def upcast(self, polygons):
         return self.__class__(polygons, self._xs)
 
     def dup(self):
-        return self.__class__(self._polygons, self._xs)
+        ld = self.__class__(self._storage, self._xs)
+        ld._version = self._version
+        return ld
 
     def __str__(self):
         n_poly = self.n_poly
@@ -286,8 +650,7 @@ class LayoutData:
         other : LayoutData or list of Polygon
 
         """
-        other_polygons = self._get_polygons(other)
-        self._polygons = self._ep.boolean_p2p(self._polygons, other_polygons, EP.ModeOr)
+        self._polygons = self._boolean(other, EP.ModeOr)
 
     def and_(self, other):
         """Calculate overlap of the mask with a list of polygons (AND).
@@ -300,15 +663,10 @@ class LayoutData:
         -------
         ld : LayoutData
         """
-        other_polygons = self._get_polygons(other)
-        return self.upcast(
-            self._ep.boolean_p2p(self._polygons, other_polygons, EP.ModeAnd)
-        )
+        return self.upcast(self._boolean(other, EP.ModeAnd))
 
     def invert(self):
-        self._polygons = self._ep.boolean_p2p(
-            self._polygons, [Polygon(self._xs.background())], EP.ModeXor
-        )
+        self._polygons = self._boolean([Polygon(self._xs.background())], EP.ModeXor)
 
     def inverted(self):
         """Calculate inversion of the mask.
@@ -319,18 +677,15 @@ class LayoutData:
         -------
         ld : LayoutData
         """
-        return self.upcast(
-            self._ep.boolean_p2p(
-                self._polygons, [Polygon(self._xs.background())], EP.ModeXor
-            )
-        )
+        return self.upcast(self._boolean([Polygon(self._xs.background())], EP.ModeXor))
 
     @print_info(False)
     def load(self, layout, cell, box, layer_spec):
         """Load all shapes from the layer into self._polygons.
 
         The shapes are collected from layer defined by layer_spec. Only
-        shapes touching the box are loaded. Box is effectively a ruler region.
+        shapes touching the box are loaded, and they are clipped to the
+        box. Box is effectively a ruler region.
 
         Parameters
         ----------
@@ -346,30 +701,19 @@ class LayoutData:
         """
         info(f"LD.load(..., box={box}, layer_spec={layer_spec})")
 
-        ls = string_to_layer_info(layer_spec)
-
         # look up the layer index with a given layer_spec in the current layout
-        layer_index = None
-        for li in layout.layer_indices():
-            info(f"    li = {li}")
-            if layout.get_info(li).is_equivalent(ls):
-                info(f"        layer_index = {li}")
-                layer_index = li
-                break
+        layer_index = find_layer_index(layout, layer_spec)
+        info(f"    layer_index = {layer_index}")
 
         # collect polygons from the specified layer
-        # all the shapes from the layout will be saved in self._polygons
+        # all the shapes from the layout will be saved in self._polygons.
+        # Shapes are flattened and clipped to the box in one go by Region.
         if layer_index is not None:
-            info("    iterations:")
-            shape_iter = layout.begin_shapes_touching(cell, layer_index, box)
-
-            while not shape_iter.at_end():
-                shape = shape_iter.shape()
-                if shape.is_polygon() or shape.is_path() or shape.is_box():
-                    self._polygons.append(
-                        shape.polygon.transformed(shape_iter.itrans())
-                    )
-                shape_iter.next()
+            shape_iter = RecursiveShapeIterator(
+                layout, layout.cell(cell), layer_index, box, False
+            )
+            region = Region(shape_iter) & Region(box)
+            self._polygons = self._polygons + list(region.each())
 
         n_poly = self.n_poly
         info(f"    loaded polygon count: {n_poly}")
@@ -388,10 +732,7 @@ class LayoutData:
         other : LayoutData or list of Polygon
 
         """
-        other_polygons = self._get_polygons(other)
-        self._polygons = self._ep.boolean_p2p(
-            self._polygons, other_polygons, EP.ModeAnd
-        )
+        self._polygons = self._boolean(other, EP.ModeAnd)
 
     @property
     def n_poly(self):
@@ -415,10 +756,7 @@ class LayoutData:
         -------
         ld : LayoutData
         """
-        other_polygons = self._get_polygons(other)
-        return self.upcast(
-            self._ep.boolean_p2p(self._polygons, other_polygons, EP.ModeANotB)
-        )
+        return self.upcast(self._boolean(other, EP.ModeANotB))
 
     __sub__ = not_
 
@@ -433,10 +771,7 @@ class LayoutData:
         -------
         ld : LayoutData
         """
-        other_polygons = self._get_polygons(other)
-        return self.upcast(
-            self._ep.boolean_p2p(self._polygons, other_polygons, EP.ModeOr)
-        )
+        return self.upcast(self._boolean(other, EP.ModeOr))
 
     __add__ = or_
     __iadd__ = or_
@@ -453,10 +788,8 @@ class LayoutData:
 
         """
         dy = dx if dy is None else dy
-        self._polygons = self._ep.size_p2p(
-            self._polygons,
-            int_floor(dx / self._xs.dbu + 0.5),
-            int_floor(dy / self._xs.dbu + 0.5),
+        self._polygons = self._size(
+            int_floor(dx / self._xs.dbu + 0.5), int_floor(dy / self._xs.dbu + 0.5)
         )
 
     def sized(self, dx, dy=None):
@@ -475,10 +808,8 @@ class LayoutData:
         """
         dy = dx if dy is None else dy
         return self.upcast(
-            self._ep.size_p2p(
-                self._polygons,
-                int_floor(dx / self._xs.dbu + 0.5),
-                int_floor(dy / self._xs.dbu + 0.5),
+            self._size(
+                int_floor(dx / self._xs.dbu + 0.5), int_floor(dy / self._xs.dbu + 0.5)
             )
         )
 
@@ -490,10 +821,7 @@ class LayoutData:
         other : LayoutData or list of Polygon
 
         """
-        other_polygons = self._get_polygons(other)
-        self._polygons = self._ep.boolean_p2p(
-            self._polygons, other_polygons, EP.ModeANotB
-        )
+        self._polygons = self._boolean(other, EP.ModeANotB)
 
     def transform(self, t):
         """Transform mask with a transformation.
@@ -503,7 +831,10 @@ class LayoutData:
         t : Trans
             transformation to be applied
         """
-        self._polygons = [p.transformed(t) for p in self._polygons]
+        if self._region_storage:
+            self._polygons = self.region.transformed(t)
+        else:
+            self._polygons = [p.transformed(t) for p in self._polygons]
 
     def xor(self, other):
         """Calculate XOR with another list of polygons.
@@ -516,10 +847,7 @@ class LayoutData:
         -------
         ld : LayoutData
         """
-        other_polygons = self._get_polygons(other)
-        return self.upcast(
-            self._ep.boolean_p2p(self._polygons, other_polygons, EP.ModeXor)
-        )
+        return self.upcast(self._boolean(other, EP.ModeXor))
 
     def close_gaps(self):
         """Close gaps in self._polygons.
@@ -527,22 +855,54 @@ class LayoutData:
         Increase size of all polygons by 1 dbu in all directions.
         """
         sz = 1
-        d = self._polygons
-        d = self._ep.size_p2p(d, 0, sz)
-        d = self._ep.size_p2p(d, 0, -sz)
-        d = self._ep.size_p2p(d, sz, 0)
-        d = self._ep.size_p2p(d, -sz, 0)
-        self._polygons = d
+        for dx, dy in ((0, sz), (0, -sz), (sz, 0), (-sz, 0)):
+            self._polygons = self._size(dx, dy)
 
     def remove_slivers(self):
         """Remove slivers in self._polygons."""
         sz = 1
-        d = self._polygons
-        d = self._ep.size_p2p(d, 0, -sz)
-        d = self._ep.size_p2p(d, 0, sz)
-        d = self._ep.size_p2p(d, -sz, 0)
-        d = self._ep.size_p2p(d, sz, 0)
-        self._polygons = d
+        for dx, dy in ((0, -sz), (0, sz), (-sz, 0), (sz, 0)):
+            self._polygons = self._size(dx, dy)
+
+    def _boolean(self, other, mode):
+        """Boolean operation with another list of polygons.
+
+        Parameters
+        ----------
+        other : LayoutData or list of Polygon
+        mode : int
+            EP.ModeAnd, EP.ModeANotB, EP.ModeOr or EP.ModeXor
+
+        Returns
+        -------
+        polygons : list of Polygon or Region
+            a Region with XSectionGenerator.region_storage(True)
+        """
+        if not self._region_storage:
+            other_polygons = self._get_polygons(other)
+            return self._ep.boolean_p2p(self._polygons, other_polygons, mode)
+
+        a = self.region
+        b = other.region if isinstance(other, LayoutData) else _to_region(other)
+        if mode == EP.ModeAnd:
+            return a & b
+        if mode == EP.ModeANotB:
+            return a - b
+        if mode == EP.ModeOr:
+            return a | b
+        return a ^ b
+
+    def _size(self, dx, dy):
+        """Sizing in dbu, see EdgeProcessor.size_p2p()
+
+        Returns
+        -------
+        polygons : list of Polygon or Region
+            a Region with XSectionGenerator.region_storage(True)
+        """
+        if self._region_storage:
+            return self.region.sized(dx, dy, 2)
+        return self._ep.size_p2p(self._polygons, dx, dy)
 
     @staticmethod
     def _get_polygons(l):
@@ -556,6 +916,144 @@ class LayoutData:
             )
 
 
+class _Thunk:
+    """Polygons computed on first call and memoized."""
+
+    __slots__ = ("_compute", "_result")
+
+    def __init__(self, compute=None, result=None):
+        self._compute = compute
+        self._result = result
+
+    @property
+    def done(self):
+        return self._compute is None
+
+    def __call__(self):
+        if self._compute is not None:
+            self._result = self._compute()
+            self._compute = None
+        return self._result
+
+
+class LazyLayoutData(LayoutData):
+    """Layout data computed on first use.
+
+    XSectionGenerator.layer() returns lazy layers, so that the layers a
+    cut does not use are never loaded. The boolean and sizing operations
+    of a lazy layer return lazy layers as well, which are evaluated when
+    their polygons are consumed, e.g. by mask() or output(). In-place
+    operations evaluate the layer right away.
+
+    The operands are captured when the operation is called, so later
+    in-place modifications of them do not change the result, just like
+    for LayoutData.
+    """
+
+    def __init__(self, compute, xs):
+        """
+        Parameters
+        ----------
+        compute : callable
+            returns the list of Polygon of this layer
+        xs : XSectionGenerator
+        """
+        super().__init__([], xs)
+        self._thunk = compute if isinstance(compute, _Thunk) else _Thunk(compute)
+        self._modified = False
+        self._version = next(_versions)
+        # Region of the polygons, and the polygons it was made of
+        self._region = self._region_of = None
+
+    @property
+    def _polygons(self):
+        return self._thunk()
+
+    @_polygons.setter
+    def _polygons(self, polygons):
+        if isinstance(polygons, Region):
+            self._region = polygons
+            polygons = self._region_of = list(polygons.each())
+        self._thunk = _Thunk(result=polygons)
+        self._modified = True
+        self._version = next(_versions)
+
+    @property
+    def _storage(self):
+        return self._polygons
+
+    @property
+    def region(self):
+        polygons = self._polygons
+        if self._region_of is not polygons:
+            self._region, self._region_of = _to_region(polygons), polygons
+        return self._region
+
+    @property
+    def is_loaded(self):
+        """True if the polygons have been computed."""
+        return self._thunk.done
+
+    def upcast(self, polygons):
+        return LayoutData(polygons, self._xs)
+
+    def dup(self):
+        ld = LazyLayoutData(self._thunk, self._xs)
+        ld._version = self._version
+        return ld
+
+    def __str__(self):
+        if not self.is_loaded:
+            return "LazyLayoutData (not loaded)"
+        return super().__str__()
+
+    def __repr__(self):
+        if not self.is_loaded:
+            return "<LazyLayoutData (not loaded)>"
+        return super().__repr__()
+
+    def _deferred(self, method, *args):
+        """Return a lazy layer evaluating method(self, *args) on first use."""
+        source = self._thunk
+        args = [
+            a._thunk
+            if isinstance(a, LazyLayoutData)
+            else a.data
+            if isinstance(a, LayoutData)
+            else a
+            for a in args
+        ]
+
+        def compute():
+            ld = LayoutData(source(), self._xs)
+            return method(ld, *[a() if isinstance(a, _Thunk) else a for a in args]).data
+
+        return LazyLayoutData(compute, self._xs)
+
+    def and_(self, other):
+        return self._deferred(LayoutData.and_, other)
+
+    def inverted(self):
+        # the background depends on extend() and delta(), take it now
+        return self._deferred(LayoutData.xor, [Polygon(self._xs.background())])
+
+    def not_(self, other):
+        return self._deferred(LayoutData.not_, other)
+
+    def or_(self, other):
+        return self._deferred(LayoutData.or_, other)
+
+    def sized(self, dx, dy=None):
+        return self._deferred(LayoutData.sized, dx, dy)
+
+    def xor(self, other):
+        return self._deferred(LayoutData.xor, other)
+
+    __sub__ = not_
+    __add__ = or_
+    __iadd__ = or_
+
+
 class MaskData(LayoutData):
     """Class to operate 2D cross-sections.
 
@@ -568,7 +1066,7 @@ class MaskData(LayoutData):
         """
         Parameters
         ----------
-        air_polygons : list of Polygon
+        air_polygons : list of Polygon or Region
             list of shapes constituting air in cross-section
         mask_polygons : list of Polygon
             list of shapes constituting material in cross-section
@@ -587,6 +1085,8 @@ class MaskData(LayoutData):
         info("Success!")
 
     def upcast(self, polygons):
+        if isinstance(polygons, Region):
+            polygons = list(polygons.each())
         return MaskData(self._air_polygons, polygons, self._xs)
 
     def dup(self):
@@ -698,8 +1198,7 @@ class MaskData(LayoutData):
 
         # consume material
         if into:
-            for i in into:  # for each MaterialData
-                i.sub(res)
+            self._consume(res, into, removed=False)
         else:
             self._xs.air().sub(res)  # remove air where material was added
         return res
@@ -766,10 +1265,7 @@ class MaskData(LayoutData):
         res = MaterialData(d, self._xs)
 
         # consume material and add to air
-        for i in into:  # for each MaterialData
-            j = LayoutData(i.data, self._xs)
-            i.sub(res)
-            j.sub(i)
+        for j in self._consume(res, into):
             self._xs.air().add(j)
 
         # Add air in place of the etched materials
@@ -798,7 +1294,8 @@ class MaskData(LayoutData):
 
         Returns
         -------
-        d : list of Polygon
+        d : list of Polygon or Region
+            a Region with XSectionGenerator.region_storage(True)
         """
         info(f"    method={method}, xy={xy}, z={z},")
         info(f"    into={into}, through={through}, on={on},")
@@ -824,15 +1321,10 @@ class MaskData(LayoutData):
         # into_data is a list of polygons from all `into` MaterialData
         # Finally we get a into_data, which is a list of Polygons
         if into:
-            into_data = []
-            for i in into:
-                if len(into_data) == 0:
-                    into_data = i.data
-                else:
-                    into_data = self._ep.boolean_p2p(i.data, into_data, EP.ModeOr)
+            into_data = self._union(into)
         else:
             # when deposit or grow is selected, into_data is self.air()
-            into_data = self._xs.air().data
+            into_data = self._xs.air()._storage
 
         info(f"    into_data = {into_data}")
 
@@ -841,24 +1333,14 @@ class MaskData(LayoutData):
         # through_data is a list of polygons from all `through` MaterialData
         # Finally we get a through_data, which is a list of Polygons
         if through:
-            through_data = []
-            for i in through:
-                if len(through_data) == 0:
-                    through_data = i.data
-                else:
-                    through_data = self._ep.boolean_p2p(i.data, through_data, EP.ModeOr)
+            through_data = self._union(through)
             info(f"    through_data = {through_data}")
 
         # determine the "on" material by joining the data of all "on" specs
         # on_data is a list of polygons from all `on` MaterialData
         # Finally we get an on_data, which is a list of Polygons
         if on:
-            on_data = []
-            for i in on:
-                if len(on_data) == 0:
-                    on_data = i.data
-                else:
-                    on_data = self._ep.boolean_p2p(i.data, on_data, EP.ModeOr)
+            on_data = self._union(on)
             info(f"    on_data = {on_data}")
 
         pi = int_floor(prebias / self._xs.dbu + 0.5)
@@ -876,10 +1358,20 @@ class MaskData(LayoutData):
                 xyi = pi
 
         mp = self._ep.size_p2p(self._mask_polygons, -pi, 0, 2)
-        air_masked = self._ep.boolean_p2p(self._air_polygons, mp, EP.ModeAnd)
-        me = (Edges(air_masked) if air_masked else Edges()) - (
-            Edges(mp) if mp else Edges()
-        )
+
+        if self._xs.surface_engine_enabled:
+            d = self._produce_geom_on_surface(
+                xyi, zi, mp, into or through or on, taper, mode, buried
+            )
+            if d is not None:
+                return d
+
+        if isinstance(self._air_polygons, Region):
+            me = (self._air_polygons & _to_region(mp)).edges()
+        else:
+            air_masked = self._ep.boolean_p2p(self._air_polygons, mp, EP.ModeAnd)
+            me = Edges(air_masked) if air_masked else Edges()
+        me -= Edges(mp) if mp else Edges()
         info(f"me after creation: {me}")
 
         # in the "into" case determine the interface region between
@@ -893,92 +1385,301 @@ class MaskData(LayoutData):
                 data = into_data
 
             info(f"data = {data}")
-            me = (me & Edges(data)) if data else list()
+            if isinstance(data, Region):
+                me = me & data.edges()
+            else:
+                me = (me & Edges(data)) if data else Edges()
 
             # if len(data) == 0:
             #     me = []
             # else:
             #     me += Edges(data)
+            # drop the edges whose sums cannot reach the "into" material.
+            # With "into" alone, all the edges are on its boundary.
+            if into and (through or on or abs(buried or 0.0) > 1e-6):
+                me = self._edges_near(me, into_data, xyi, zi, buried)
+
         info(f"type(me): {type(me)}")  # list of Edge
         info(f"me before operation: {me}")
 
-        d = Region()
+        sums = []  # Minkowski sums of the kernel with each edge of me
+        boxes = None  # sums of the horizontal and vertical edges in square mode
+        merge_every = None
 
         if taper and xyi > 0:
             info("    case taper and xyi > 0")
-            kernel_pts = list()
-            kernel_pts.append(Point(-xyi, 0))
-            kernel_pts.append(Point(0, zi))
-            kernel_pts.append(Point(xyi, 0))
-            kernel_pts.append(Point(0, -zi))
-            kp = Polygon(kernel_pts)
-            for e in me:
-                d.insert(kp.minkowsky_sum(e, False))
+            kp = kernel_polygon("taper", xyi, zi)
+            sums = [kp.minkowsky_sum(e, False) for e in me]
 
         elif xyi <= 0:
             info("    case xyi <= 0")
             # TODO: there is no way to do that with a Minkowsky sum currently
             # since polygons cannot be lines except through dirty tricks
+            # the sums of vertical edges are empty, those of horizontal edges
+            # are boxes
             dz = Point(0, zi)
-            for e in me:
-                d.insert(Polygon([e.p1 - dz, e.p2 - dz, e.p2 + dz, e.p1 + dz]))
+            boxes = me.with_angle(0, False).extended(0, 0, zi, zi, False)
+            sums = [
+                Polygon([e.p1 - dz, e.p2 - dz, e.p2 + dz, e.p1 + dz])
+                for e in me.with_angle(Edges.OrthoEdges, True)
+            ]
         elif mode in ("round", "octagon"):
             info("    case round / octagon")
-            # approximate round corners by 64 points for "round" and
-            # 8 for "octagon"
-            n = 64 if mode == "round" else 8
-            da = 2.0 * math.pi / n
-            rf = 1.0 / math.cos(da * 0.5)
-
-            info(f"    n = {n}, da = {da}, rf = {rf}")
-            kernel_pts = list()
-            for i in range(n):
-                kernel_pts.append(
-                    Point.from_dpoint(
-                        DPoint(
-                            xyi * rf * math.cos(da * (i + 0.5)),
-                            zi * rf * math.sin(da * (i + 0.5)),
-                        )
-                    )
-                )
-            info(f"    n kernel_pts: {len(kernel_pts)}")
-            info(f"    kernel_pts: {kernel_pts}")
-
-            kp = Polygon(kernel_pts)
-            for n, e in enumerate(me):
-                d.insert(kp.minkowsky_sum(e, False))
-                if n > 0 and n % 10 == 0:
-                    d.merge()
+            # approximate round corners by 64 points (or as many as
+            # needed for round_tolerance()) for "round" and 8 for "octagon"
+            n = 8
+            if mode == "round":
+                tolerance = self._xs.round_tolerance_dbu
+                n = round_kernel_points(max(xyi, zi), tolerance)
+            kp = kernel_polygon("round", xyi, zi, n)
+            sums = [kp.minkowsky_sum(e, False) for e in me]
+            merge_every = 10
 
         elif mode == "square":
-            kernel_pts = list()
-            kernel_pts.append(Point(-xyi, -zi))
-            kernel_pts.append(Point(-xyi, zi))
-            kernel_pts.append(Point(xyi, zi))
-            kernel_pts.append(Point(xyi, -zi))
-            kp = SimplePolygon()
-            kp.set_points(kernel_pts, True)  # "raw" - don't optimize away
-            for e in me:
-                d.insert(kp.minkowsky_sum(e, False))
-
-        d.merge()
+            # the sums of horizontal and vertical edges are boxes, built in
+            # one go by Edges.extended()
+            boxes = me.with_angle(0, False).extended(xyi, xyi, zi, zi, False)
+            boxes += me.with_angle(90, False).extended(zi, zi, xyi, xyi, False)
+            kp = kernel_polygon("square", xyi, zi)
+            sums = [
+                kp.minkowsky_sum(e, False)
+                for e in me.with_angle(Edges.OrthoEdges, True)
+            ]
+
+        # in round and octagon mode, the kernels have many points and the
+        # sums are merged while they are collected
+        strategy = self._xs.merge_strategy_name if merge_every else "final"
+        d = merge_sums(sums, strategy, merge_every, boxes)
         info(f"d after merge: {d}")
 
         if abs(buried or 0.0) > 1e-6:
             t = Trans(Point(0, -int_floor(buried / self._xs.dbu + 0.5)))
             d.transform(t)
         if through:
-            d -= Region(through_data)
-        d &= Region(into_data)
+            d -= _to_region(through_data)
+        d &= _to_region(into_data)
 
+        if self._region_storage:
+            return d
         poly = [p for p in d]
         return poly
 
+    def _union(self, materials):
+        """Return the union of the polygons of materials.
+
+        Parameters
+        ----------
+        materials : list of MaterialData
+
+        Returns
+        -------
+        polygons : list of Polygon or Region
+            a Region with XSectionGenerator.region_storage(True)
+        """
+        # scripts use the same material lists again and again, so the
+        # union is cached until one of the materials changes
+        key = tuple(id(i) for i in materials)
+        versions = (self._region_storage,) + tuple(i.version for i in materials)
+        cached = self._xs._union_cache.get(key)
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+
+        if self._region_storage:
+            data = Region()
+            for i in materials:
+                data = i.region if data.is_empty() else i.region | data
+        else:
+            data = []
+            for i in materials:
+                if len(data) == 0:
+                    data = i.data
+                else:
+                    data = self._ep.boolean_p2p(i.data, data, EP.ModeOr)
+
+        if len(materials) > 1:
+            self._xs._union_cache[key] = (versions, data)
+        return data
+
+    def _consume(self, res, materials, removed=True):
+        """Remove the new material from other materials.
+
+        Each material is split into the parts outside and inside res in a
+        single pass. Materials not overlapping the bounding box of res are
+        left untouched.
+
+        Parameters
+        ----------
+        res : MaterialData
+        materials : list of MaterialData
+        removed : bool
+            if False, the parts inside res are not computed
+
+        Returns
+        -------
+        removed : list of Region
+            the parts of the materials inside res
+        """
+        res_region = res.region
+        box = res_region.bbox()
+
+        parts = []
+        for i in materials:
+            region = i.region
+            if not box.overlaps(region.bbox()):
+                continue
+            if not removed:
+                kept = region - res_region
+            elif hasattr(region, "andnot"):  # KLayout >= 0.27
+                part, kept = region.andnot(res_region)
+                parts.append(part)
+            else:
+                part, kept = region & res_region, region - res_region
+                parts.append(part)
+            i.data = kept if self._region_storage else list(kept.each())
+        return parts
+
+    def _edges_near(self, edges, polygons, xyi, zi, buried):
+        """Return the edges whose Minkowski sums can reach the polygons.
+
+        The kernels extend by at most xyi / cos(pi / 8) to the sides and
+        zi / cos(pi / 8) up and down (the octagon), and the sums are moved
+        down by buried.
+
+        Parameters
+        ----------
+        edges : Edges
+        polygons : list of Polygon
+        xyi : int
+            in dbu
+        zi : int
+            in dbu
+        buried : float or None
+            in um
+
+        Returns
+        -------
+        edges : Edges
+        """
+        rf = 1.0 / math.cos(math.pi / 8.0)
+        # the kernels are symmetric, so the sign of xyi and zi does not matter
+        m = Point(math.ceil(abs(xyi) * rf) + 1, math.ceil(abs(zi) * rf) + 1)
+        bi = int_floor((buried or 0.0) / self._xs.dbu + 0.5)
+
+        reach = Region()
+        boxes = [p.bbox().enlarged(m).moved(0, bi) for p in polygons]
+        if boxes:
+            reach.insert(boxes)
+        return edges.interacting(reach)
+
+    def _produce_geom_on_surface(self, xyi, zi, mp, selective, taper, mode, buried):
+        """Produce the geometry of a deposition with the surface engine.
+
+        See klayout_pyxs.surface_2d. Only non-selective square grows of a
+        rectilinear surface are handled.
+
+        Returns
+        -------
+        d : list of Polygon or None
+            None if the polygon engine has to be used
+        """
+        if selective or taper or abs(buried or 0.0) > 1e-6 or zi < 0:
+            return None
+        if xyi > 0 and mode != "square":
+            return None
+        if self._air_polygons is not self._xs.air()._storage:
+            return None  # air changed since the mask was created
+
+        air = self._air_polygons
+        profile = air_profile(air if isinstance(air, list) else list(air.each()))
+        if profile is None:
+            return None
+
+        # the mask columns must cut through the air, so that only the
+        # surface is grown (and not the bottom of the air after flip())
+        air_box = profile[1]
+        columns = []
+        for p in mp:
+            box = p.bbox()
+            if not p.is_box() or box.bottom >= air_box.bottom or box.top != air_box.top:
+                return None
+            columns.append((box.left, box.right))
+
+        info("    case surface engine")
+        d = grow_profile(profile, columns, max(xyi, 0), zi)
+        return [p for p in d]
+
 
 class MaterialData(LayoutData):
+    """Layout data of a material in the cross-section.
+
+    add() and sub() are deferred: the operands are collected and applied
+    the first time the polygons are read, with a single boolean for each
+    run of additions or subtractions. This way an etch into many
+    materials, which adds the etched part of each of them to the air,
+    merges the air only once.
+    """
+
     def __init__(self, polygons, xs):
         super().__init__(polygons, xs)
 
+    @property
+    def _polygons(self):
+        self._resolve()
+        return LayoutData._polygons.fget(self)
+
+    @_polygons.setter
+    def _polygons(self, polygons):
+        # pending operations of (mode, list of operands)
+        self._pending = []
+        LayoutData._polygons.fset(self, polygons)
+
+    @property
+    def _storage(self):
+        self._resolve()
+        return LayoutData._storage.fget(self)
+
+    @property
+    def region(self):
+        self._resolve()
+        return LayoutData.region.fget(self)
+
+    def add(self, other):
+        """Add more polygons to the layout (OR), see LayoutData.add()"""
+        self._defer(EP.ModeOr, other)
+
+    def sub(self, other):
+        """Subtract another list of polygons, see LayoutData.sub()"""
+        self._defer(EP.ModeANotB, other)
+
+    def _defer(self, mode, other):
+        # the operands are copy-on-write, so they can be kept as they are
+        other = other._storage if isinstance(other, LayoutData) else other
+        if self._pending and self._pending[-1][0] == mode:
+            self._pending[-1][1].append(other)
+        else:
+            self._pending.append((mode, [other]))
+        self._version = next(_versions)
+
+    def _resolve(self):
+        """Apply the pending add() and sub() operations."""
+        if not self._pending:
+            return
+        pending, version = self._pending, self._version
+        self._pending = []
+        for mode, operands in pending:
+            if self._region_storage:
+                other = Region()
+                for o in operands:
+                    other += _to_region(o)
+            else:
+                other = [
+                    p
+                    for o in operands
+                    for p in (o.each() if isinstance(o, Region) else o)
+                ]
+            self._polygons = self._boolean(other, mode)
+        self._version = version
+
     def discard(self):
         self._xs.air().add(self)
 
@@ -0,0 +1,290 @@
+"""klayout_pyxs.layer_cache.py
+
+Layer shapes shared by all cuts of one run, or by all runs on a layout.
+
+"""
+import weakref
+
+from klayout_pyxs import (
+    HAS_NUMPY,
+    Box,
+    DPoint,
+    Edge,
+    Edges,
+    Layout,
+    Point,
+    RecursiveShapeIterator,
+    Region,
+)
+from klayout_pyxs.geometry_2d import sweep_crossing_points
+from klayout_pyxs.layer_parameters import find_layer_index
+from klayout_pyxs.utils import int_floor
+
+# per-layout spatial indices, see layout_index()
+_layout_indices = weakref.WeakKeyDictionary()
+
+
+class LayerCache:
+    """Flattened layer shapes shared by the cuts of one run.
+
+    Each layer requested by layer() is loaded once from the source layout
+    for a box covering all cuts of the run, flattened into a single cell
+    of a scratch layout. Every cut then only clips its own window out of
+    that cell, which is a box tree query instead of a walk through the
+    source cell hierarchy. mask() uses the same box tree to pick only the
+    polygons touching the ruler.
+
+    If the rulers of the cuts are known, mask() takes the crossing points
+    of a layer with its ruler from a single sweep over all the rulers,
+    see crossing_points().
+    """
+
+    def __init__(self, layout, cell, box=None, lines=None):
+        """
+        Parameters
+        ----------
+        layout : Layout
+            source layout
+        cell : int
+            index of the source cell
+        box : Box (optional)
+            region to be cached, in dbu. Usually the union of the boxes of
+            all cuts of the run, see for_cuts(). If None, the layers are
+            flattened completely, see layout_index().
+        lines : list of Edge (optional)
+            rulers of the cuts, in dbu
+        """
+        # the source layout is not kept alive by the cache, so that
+        # layout_index() does not hold on to the layouts it has indexed
+        self._layout_ref = weakref.ref(layout)
+        self._cell = cell
+        self._box = box
+
+        self._cache_layout = Layout()
+        self._cache_layout.dbu = layout.dbu
+        self._cache_cell = self._cache_layout.create_cell("LAYER_CACHE")
+
+        # source layer index -> (cache layer index, cached box)
+        self._layers = {}
+
+        self._lines = list(lines or [])
+        self._line_keys = {_line_key(line) for line in self._lines}
+        # (layer_spec, extend) -> {line key: crossing points}
+        self._crossings = {}
+
+    @property
+    def _layout(self):
+        layout = self._layout_ref()
+        if layout is None:
+            raise ReferenceError("the source layout of the cache was deleted")
+        return layout
+
+    @classmethod
+    def for_cuts(cls, layout, cell, cuts, margin=2.0):
+        """Create a cache covering a list of cuts.
+
+        Parameters
+        ----------
+        layout : Layout
+            source layout
+        cell : int
+            index of the source cell
+        cuts : list of tuple
+            (p1, p2) pairs of (x, y) ruler end points, in micron
+        margin : float
+            extension of the cached box around the cuts, in micron. Should
+            not be smaller than the extend() value used by the script,
+            otherwise the layers are reloaded for the larger box.
+
+        Returns
+        -------
+        LayerCache
+        """
+        dbu = layout.dbu
+        box = Box()
+        lines = []
+        for p1, p2 in cuts:
+            # same rounding as XSectionGenerator
+            p1_dbu = Point.from_dpoint(DPoint(*p1) * (1.0 / dbu))
+            p2_dbu = Point.from_dpoint(DPoint(*p2) * (1.0 / dbu))
+            lines.append(Edge(p1_dbu, p2_dbu))
+            box += lines[-1].bbox()
+        m = int_floor(margin / dbu + 0.5)
+        return cls(layout, cell, box.enlarged(Point(m, m)), lines)
+
+    def layout_for(self, layer_spec, box):
+        """Return the layout to load a layer from.
+
+        Parameters
+        ----------
+        layer_spec : str
+            layer to be loaded
+        box : Box
+            region to be loaded, in dbu
+
+        Returns
+        -------
+        layout : Layout
+        cell : int
+            cell index. The cached layer has the same layer info as the
+            source layer, so it can be looked up with layer_spec.
+        """
+        li = find_layer_index(self._layout, layer_spec)
+        if li is None:
+            return self._layout, self._cell
+
+        cached = self._layers.get(li)
+        if cached is None:
+            self._load(li, box)
+        elif cached[1] is not None and not (
+            cached[1].contains(box.p1) and cached[1].contains(box.p2)
+        ):
+            self._load(li, cached[1] + box)
+        return self._cache_layout, self._cache_cell.cell_index()
+
+    def polygons_touching(self, layer_spec, edge):
+        """Return the polygons of a layer touching an edge.
+
+        See polygons_touching() (the module function).
+
+        Parameters
+        ----------
+        layer_spec : str
+        edge : Edge
+            in dbu
+
+        Returns
+        -------
+        polygons : list of Polygon
+        """
+        layout, cell = self.layout_for(layer_spec, edge.bbox())
+        return polygons_touching(layout, cell, layer_spec, edge)
+
+    def crossing_points(self, layer_spec, line, extend):
+        """Return the crossing points of a layer with one of the rulers.
+
+        The crossing points are computed for all the rulers of the cache
+        at once on the first call for a layer and extend value, see
+        sweep_crossing_points().
+
+        Parameters
+        ----------
+        layer_spec : str
+        line : Edge
+            ruler, in dbu
+        extend : int
+            extension of the ruler, in dbu
+
+        Returns
+        -------
+        crossing_points : list of list or None
+            [z, s] crossing points as computed by mask(), or None if the
+            ruler is not one of the cache or numpy is not available
+        """
+        key = _line_key(line)
+        if not HAS_NUMPY or key not in self._line_keys:
+            return None
+
+        sweep = self._crossings.get((layer_spec, extend))
+        if sweep is None:
+            box = Box()
+            for ln in self._lines:
+                box += ln.bbox()
+            box = box.enlarged(Point(extend + 2, extend + 2))
+
+            layout, cell = self.layout_for(layer_spec, box)
+            li = find_layer_index(layout, layer_spec)
+            polygons = []
+            if li is not None:
+                shape_iter = RecursiveShapeIterator(
+                    layout, layout.cell(cell), li, box, False
+                )
+                polygons = list(Region(shape_iter).each())
+
+            points = sweep_crossing_points(polygons, self._lines, extend)
+            sweep = dict(zip(map(_line_key, self._lines), points))
+            self._crossings[(layer_spec, extend)] = sweep
+        return sweep[key]
+
+    def _load(self, li, box):
+        """(Re)load a source layer into the cache for a given box"""
+        if li in self._layers:
+            cli = self._layers[li][0]
+            self._cache_cell.shapes(cli).clear()
+        else:
+            cli = self._cache_layout.insert_layer(self._layout.get_info(li))
+
+        if self._box is None:
+            # complete spatial index of the layer
+            box = None
+            shape_iter = RecursiveShapeIterator(
+                self._layout, self._layout.cell(self._cell), li
+            )
+            self._cache_cell.shapes(cli).insert(shape_iter)
+        else:
+            box = box + self._box
+            shape_iter = RecursiveShapeIterator(
+                self._layout, self._layout.cell(self._cell), li, box, False
+            )
+            self._cache_cell.shapes(cli).insert(Region(shape_iter) & Region(box))
+        self._layers[li] = (cli, box)
+
+
+def polygons_touching(layout, cell, layer_spec, edge):
+    """Return the polygons of a layer touching an edge.
+
+    This is a box tree query for the bounding box of the edge, which is a
+    degenerate strip for horizontal and vertical edges, followed by an
+    exact interaction check for diagonal edges. The polygons are
+    flattened, but not clipped.
+
+    Parameters
+    ----------
+    layout : Layout
+    cell : int
+        cell index
+    layer_spec : str
+    edge : Edge
+        in dbu
+
+    Returns
+    -------
+    polygons : list of Polygon
+    """
+    li = find_layer_index(layout, layer_spec)
+    if li is None:
+        return []
+
+    box = edge.bbox()
+    region = Region(RecursiveShapeIterator(layout, layout.cell(cell), li, box, False))
+    if edge.dx() != 0 and edge.dy() != 0:
+        region = region.interacting(Edges([edge]))
+    return list(region.each())
+
+
+def _line_key(line):
+    return line.p1.x, line.p1.y, line.p2.x, line.p2.y
+
+
+def layout_index(layout, cell):
+    """Return the spatial index of the flattened layers of a cell.
+
+    The index is a LayerCache without a box limit. It is built once per
+    layout and cell (each layer when it is first used) and reused by all
+    the runs in the current process, so the layout must not be modified
+    afterwards. The index is dropped when the layout is deleted.
+
+    Parameters
+    ----------
+    layout : Layout
+    cell : int
+        cell index
+
+    Returns
+    -------
+    LayerCache
+    """
+    indices = _layout_indices.setdefault(layout, {})
+    if cell not in indices:
+        indices[cell] = LayerCache(layout, cell)
+    return indices[cell]
@@ -12,9 +12,13 @@ Changelog
     Initial commit
 """
 import re
+import weakref
 
 from klayout_pyxs import LayerInfo
 
+# per-layout cache of layer indices, see find_layer_index()
+_layer_index_cache = weakref.WeakKeyDictionary()
+
 
 def string_to_layer_info_params(layer_spec, return_None=False):
     """Convert the layer specification into a LayerInfo parameters
@@ -89,6 +93,45 @@ def string_to_layer_info(layer_spec):
     return LayerInfo(*ls_param)
 
 
+def find_layer_index(layout, layer_spec):
+    """Look up the index of a layer in a layout
+
+    Found indices are cached per layout and per layer specification. A
+    cached index is checked to still refer to an equivalent layer, and the
+    cache is dropped when the number of layers in the layout changes.
+
+    Parameters
+    ----------
+    layout : Layout
+    layer_spec : str
+        format: "l", "l/d", "n(l/d)" or "n".
+
+    Returns
+    -------
+    layer_index : int or None
+        None if the layout has no such layer
+    """
+    n_layers = layout.layers()
+    cache = _layer_index_cache.get(layout)
+    if cache is None or cache[0] != n_layers:
+        cache = (n_layers, {})
+        _layer_index_cache[layout] = cache
+    indices = cache[1]
+
+    if layer_spec in indices:
+        li, ls = indices[layer_spec]
+        if layout.is_valid_layer(li) and layout.get_info(li).is_equivalent(ls):
+            return li
+
+    ls = string_to_layer_info(layer_spec)
+    for li in layout.layer_indices():
+        if layout.get_info(li).is_equivalent(ls):
+            indices[layer_spec] = (li, ls)
+            return li
+
+    return None
+
+
 def main():
     import doctest
 
@@ -18,11 +18,17 @@
 # TODO: use a much smaller dbu for the simulation to have a really small delta
 # the paths used for generating the masks are somewhat too thick
 # TODO: the left and right areas are not treated correctly
+import collections
+import json
 import math
 import os
 import re
+import shutil
+import subprocess
+import sys
+import tempfile
 
-from klayout_pyxs import HAS_PYA, Box, Edge, Point, Polygon
+from klayout_pyxs import HAS_NUMPY, HAS_PYA, Box, Edge, Layout, Point, Polygon
 from klayout_pyxs.compat import range, zip
 
 # from importlib import reload
@@ -41,12 +47,57 @@ if HAS_PYA:
 else:
     Action = object
 
-from klayout_pyxs.geometry_2d import EP, LayoutData, MaskData, MaterialData, ep
+from klayout_pyxs.geometry_2d import (
+    EP,
+    MERGE_STRATEGIES,
+    LayoutData,
+    LazyLayoutData,
+    MaskData,
+    MaterialData,
+    ep,
+    sweep_crossing_points,
+)
+from klayout_pyxs.layer_cache import polygons_touching
 from klayout_pyxs.layer_parameters import string_to_layer_info
 from klayout_pyxs.utils import info, int_floor, make_iterable, print_info
 
 info("Module klayout_pyxs.pyxs_lib.py reloaded")
 
+# compiled .pyxs scripts, see compile_script()
+_script_cache = {}
+
+
+def compile_script(file_name):
+    """Read and compile a .pyxs script.
+
+    The code object is cached by the script path and only rebuilt when
+    the modification time or the size of the file change, so a script
+    run for many rulers is read and compiled once.
+
+    Parameters
+    ----------
+    file_name : str
+        path to the .pyxs script
+
+    Returns
+    -------
+    code : code
+        compiled script, to be passed to exec()
+    """
+    path = os.path.abspath(file_name)
+    st = os.stat(path)
+    version = (st.st_mtime_ns, st.st_size)
+
+    cached = _script_cache.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with open(path) as file:
+        text = file.read()
+    code = compile(text, path, "exec")
+    _script_cache[path] = (version, code)
+    return code
+
 
 class XSectionGenerator:
     """The main class that creates a cross-section file"""
@@ -70,9 +121,24 @@ class XSectionGenerator:
         self._below = None
         self._depth = None
         self._height = None
+        self._round_tolerance = None
+        self._merge_strategy = "fixed"
+        self._surface_engine = False
+        self._region_storage = False
 
         self._is_target_layout_created = False
         self._hide_png_save_error = False
+        self._headless = False
+        self._layer_cache = None  # type: LayerCache
+        # id -> (LazyLayoutData, layer_spec, extend) of the layers returned
+        # by layer(), see _polygons_on_line()
+        self._raw_layers = {}
+        # id -> (LayoutData, version, extend, crossing points) of the
+        # layers passed to mask(), see LayoutData.version
+        self._mask_cache = {}
+        # material ids -> (versions, union) of the into, through and on
+        # materials of grow and etch, see MaskData._union()
+        self._union_cache = {}
 
         self._output_all_parameters = {
             "save_png": False,
@@ -83,25 +149,86 @@ class XSectionGenerator:
     def layer(self, layer_spec):
         """Fetches an input layer from the original layout.
 
+        The shapes are loaded when the layer is first used, so layers
+        which are declared but not used by the script cost nothing.
+
         Parameters
         ----------
         layer_spec : str
 
         Returns
         -------
-        ld : LayerData
+        ld : LazyLayoutData
 
         """
-        ld = LayoutData([], self)  # empty
-        # collect shapes from the corresponding layer into ld._polygons
-        ld.load(
-            self._layout,
-            self._cell,
-            self._line_dbu.bbox().enlarge(Point(self._extend, self._extend)),
-            layer_spec,
-        )
+        box = self._line_dbu.bbox().enlarge(Point(self._extend, self._extend))
+        layer_cache = self._layer_cache
+
+        def load():
+            if layer_cache is not None:
+                layout, cell = layer_cache.layout_for(layer_spec, box)
+            else:
+                layout, cell = self._layout, self._cell
+            # collect shapes from the corresponding layer into ld._polygons
+            ld = LayoutData([], self)  # empty
+            ld.load(layout, cell, box, layer_spec)
+            return ld.data
+
+        ld = LazyLayoutData(load, self)
+        self._raw_layers[id(ld)] = (ld, layer_spec, self._extend)
         return ld
 
+    def _raw_layer_spec(self, layer_data):
+        """Return the layer_spec of a layer returned by layer() and not
+        modified since, None otherwise.
+
+        None is returned as well if extend() has changed since layer(), as
+        the layer then holds the shapes of a different box than a query
+        with the current extend() value would return.
+        """
+        raw = self._raw_layers.get(id(layer_data))
+        if (
+            raw is None
+            or raw[2] != self._extend
+            or layer_data._modified
+            or self._line_dbu.is_degenerate()
+        ):
+            return None
+        return raw[1]
+
+    def _polygons_on_line(self, layer_data):
+        """Return the polygons of a layer which can cross the ruler.
+
+        For layers returned by layer() and not modified since, the layer
+        is not loaded. Only the polygons touching the extended ruler are
+        fetched from the layer cache or, if the layer is not loaded yet,
+        from the layout. For horizontal and vertical rulers that is a
+        query on a degenerate strip. Other polygons either miss the ruler
+        or cross its line outside of the extended ruler, where their
+        crossing points cancel out in mask().
+
+        Parameters
+        ----------
+        layer_data : LayoutData
+
+        Returns
+        -------
+        polygons : list of Polygon
+        """
+        layer_spec = self._raw_layer_spec(layer_data)
+        if layer_spec is None or (self._layer_cache is None and layer_data.is_loaded):
+            return layer_data.data
+
+        # extend the ruler by a few more dbu to be safe from rounding
+        line = self._line_dbu
+        e = (self._extend + 2) / line.length()
+        dx = int(math.copysign(math.ceil(abs(line.dx()) * e), line.dx()))
+        dy = int(math.copysign(math.ceil(abs(line.dy()) * e), line.dy()))
+        edge = Edge(line.p1.x - dx, line.p1.y - dy, line.p2.x + dx, line.p2.y + dy)
+        if self._layer_cache is not None:
+            return self._layer_cache.polygons_touching(layer_spec, edge)
+        return polygons_touching(self._layout, self._cell, layer_spec, edge)
+
     @print_info(False)
     def mask(self, layer_data):
         """Designates the layout_data object as a litho pattern (mask).
@@ -116,13 +243,74 @@ class XSectionGenerator:
         -------
         res : klayout_pyxs_repo.klayout_pyxs.geometry_2d.MaterialData
         """
-        crossing_points = []
-
         info(f"    layer_data: {layer_data}")
 
-        info(f"    n polygons in layer_data: {layer_data.n_poly}")
+        # the crossing points only depend on the layer and extend(), so
+        # they are reused when the same layer is masked again
+        version = layer_data.version
+        cached = self._mask_cache.get(id(layer_data))
+        if cached is not None and cached[1] == version and cached[2] == self._extend:
+            info("    reusing crossing points")
+            return self._xpoints_to_mask(cached[3])
+
+        # crossing points from a sweep over the rulers of all cuts
+        compressed_crossing_points = None
+        layer_spec = self._raw_layer_spec(layer_data)
+        if layer_spec is not None and self._layer_cache is not None:
+            compressed_crossing_points = self._layer_cache.crossing_points(
+                layer_spec, self._line_dbu, self._extend
+            )
+
+        if compressed_crossing_points is None:
+            polygons = self._polygons_on_line(layer_data)
+            info(f"    n polygons on the ruler: {len(polygons)}")
+
+            # numpy only pays off beyond a few polygons. For horizontal and
+            # vertical rulers, boxes are projected onto the ruler instead
+            # of intersecting their edges, which is cheap up to more of them.
+            line = self._line_dbu
+            manhattan = (line.dx() == 0) != (line.dy() == 0)
+            if HAS_NUMPY and len(polygons) > (64 if manhattan else 2):
+                compressed_crossing_points = self._crossing_points_np(polygons)
+            else:
+                compressed_crossing_points = self._crossing_points(polygons)
+
+        self._mask_cache[id(layer_data)] = (
+            layer_data,
+            version,
+            self._extend,
+            compressed_crossing_points,
+        )
+
+        # create the final intervals by selecting those crossing points which
+        # denote an entry or leave point into or out of drawn geometry. This
+        # basically does a merge of all drawn shapes.
+        return self._xpoints_to_mask(compressed_crossing_points)
+
+    @print_info(False)
+    def _crossing_points(self, polygons):
+        """Compute where the edges of polygons cross the ruler.
+
+        Parameters
+        ----------
+        polygons : list of Polygon
+
+        Returns
+        -------
+        crossing_points : list of list
+            [z, s] sorted by z, where z is the position along the ruler in
+            dbu and s the sum of the orientations of the edges crossing
+            the ruler at z (+1: "enter geometry", -1: "leave geometry")
+        """
+        crossing_points = []
+
+        line = self._line_dbu
+        manhattan = (line.dx() == 0) != (line.dy() == 0)
 
-        for polygon in layer_data.data:
+        for polygon in polygons:
+            if manhattan and polygon.is_box():
+                self._box_crossing_points(polygon.bbox(), crossing_points)
+                continue
             info(f"    polygon: {polygon}")
             for edge_dbu in polygon.each_edge():
                 info(f"        edge: {edge_dbu}")
@@ -184,11 +372,47 @@ class XSectionGenerator:
 
         if last_z and sum_s != 0:
             compressed_crossing_points.append([last_z, sum_s])
+        return compressed_crossing_points
 
-        # create the final intervals by selecting those crossing points which
-        # denote an entry or leave point into or out of drawn geometry. This
-        # basically does a merge of all drawn shapes.
-        return self._xpoints_to_mask(compressed_crossing_points)
+    def _box_crossing_points(self, box, crossing_points):
+        """Append the crossing points of a box with a horizontal or
+        vertical ruler to crossing_points.
+
+        This is a projection of the box onto the ruler, which gives the
+        same crossing points as the edge loop of _crossing_points(): the
+        two box edges across the ruler, entering at the lower position.
+        """
+        line = self._line_dbu
+        if line.dy() == 0:
+            # horizontal ruler
+            forward = line.dx() > 0
+            c, lo, hi = line.p1.y, box.bottom, box.top
+            z1, z2 = box.left - line.p1.x, box.right - line.p1.x
+            closed_low = forward
+        else:
+            forward = line.dy() > 0
+            c, lo, hi = line.p1.x, box.left, box.right
+            z1, z2 = box.bottom - line.p1.y, box.top - line.p1.y
+            closed_low = not forward
+
+        # the edges across the ruler cross it if one end point is on the
+        # left side (> 0) and the other one is not
+        if not (lo <= c < hi if closed_low else lo < c <= hi):
+            return
+        if not forward:
+            z1, z2 = -z2, -z1
+
+        z_max = line.length() + self._extend
+        z1 = min(max(z1, -self._extend), z_max)
+        z2 = min(max(z2, -self._extend), z_max)
+        crossing_points.append([z1, 1])
+        crossing_points.append([z2, -1])
+
+    def _crossing_points_np(self, polygons):
+        """Vectorized version of _crossing_points(), see
+        sweep_crossing_points().
+        """
+        return sweep_crossing_points(polygons, [self._line_dbu], self._extend)[0]
 
     # @property
     def air(self):
@@ -270,7 +494,8 @@ class XSectionGenerator:
             name extension for the newly created layout
         save_png : bool
             if True, the resulting view will be saved as an image in the
-            gds file folder
+            gds file folder. Ignored in headless mode, where there is no
+            view to render.
         """
         if script_globals is None:
             script_globals = {}
@@ -305,7 +530,7 @@ class XSectionGenerator:
                 self.output(layer_spec=ls, layer_data=ld)
 
         sp = self._output_all_parameters["save_png"] if save_png is None else save_png
-        if sp:
+        if sp and not self._headless:
             self._finalize_view()
             if step_name:
                 file_name = f"{self._cell_file_name} ({step_name}).png"
@@ -536,6 +761,100 @@ class XSectionGenerator:
     def delta_dbu(self):
         return self._delta
 
+    @print_info(False)
+    def set_round_tolerance(self, x):
+        """Configures the accuracy of the round mode of grow and etch
+
+        Parameters
+        ----------
+        x : float or None
+            maximum deviation of the round corners from the ideal ellipse,
+            in um. If None, 64 points are used for each corner.
+        """
+        self._round_tolerance = None if x is None else int_floor(x / self._dbu + 0.5)
+        info(f"XSG._round_tolerance set to {self._round_tolerance}")
+
+    @print_info(False)
+    def round_tolerance(self, x):
+        """Configures the accuracy of the round mode of grow and etch"""
+        self.set_round_tolerance(x)
+
+    @property
+    def round_tolerance_dbu(self):
+        return self._round_tolerance
+
+    @print_info(False)
+    def set_merge_strategy(self, strategy):
+        """Configures how round and octagon grow and etch merge their shapes
+
+        Parameters
+        ----------
+        strategy : str
+            'fixed|tree|final', see geometry_2d.merge_sums()
+        """
+        if strategy not in MERGE_STRATEGIES:
+            raise ValueError(
+                f"unknown merge strategy {strategy!r}, "
+                f"must be one of {', '.join(MERGE_STRATEGIES)}"
+            )
+        self._merge_strategy = strategy
+        info(f"XSG._merge_strategy set to {self._merge_strategy}")
+
+    @print_info(False)
+    def merge_strategy(self, strategy):
+        """Configures how round and octagon grow and etch merge their shapes"""
+        self.set_merge_strategy(strategy)
+
+    @property
+    def merge_strategy_name(self):
+        return self._merge_strategy
+
+    @print_info(False)
+    def set_surface_engine(self, enabled):
+        """Enables or disables the surface profile engine of grow
+
+        Parameters
+        ----------
+        enabled : bool
+            if True, simple depositions on a rectilinear surface are
+            computed from the surface profile, see surface_2d. False by
+            default.
+        """
+        self._surface_engine = bool(enabled)
+        info(f"XSG._surface_engine set to {self._surface_engine}")
+
+    @print_info(False)
+    def surface_engine(self, enabled):
+        """Enables or disables the surface profile engine of grow"""
+        self.set_surface_engine(enabled)
+
+    @property
+    def surface_engine_enabled(self):
+        return self._surface_engine
+
+    @print_info(False)
+    def set_region_storage(self, enabled):
+        """Configures how materials store their polygons
+
+        Parameters
+        ----------
+        enabled : bool
+            if True, the results of boolean and sizing operations are kept
+            as Region, so chained operations do not convert the polygons
+            to python lists. False by default.
+        """
+        self._region_storage = bool(enabled)
+        info(f"XSG._region_storage set to {self._region_storage}")
+
+    @print_info(False)
+    def region_storage(self, enabled):
+        """Configures how materials store their polygons"""
+        self.set_region_storage(enabled)
+
+    @property
+    def region_storage_enabled(self):
+        return self._region_storage
+
     @print_info(False)
     def set_height(self, x):
         """Configures the height of the processing window"""
@@ -682,32 +1001,32 @@ class XSectionGenerator:
 
         self._update_basic_regions()
 
-        text = None
         try:
-            with open(self._file_name) as file:
-                text = file.read()
-        except Exception as e:
+            code = compile_script(self._file_name)
+        except OSError as e:
             MessageBox.critical(
                 "Error",
                 f"Error reading file {self._file_name}. \n\nError: {e}",
                 MessageBox.b_ok(),
             )
             return None
-
-        if text is None:
+        except SyntaxError as e:
+            MessageBox.critical("Error", str(e), MessageBox.b_ok())
+            return None
+        except Exception as e:
+            # e.g. UnicodeDecodeError or ValueError (null bytes)
             MessageBox.critical(
                 "Error",
-                f"Error reading file {self._file_name}.",
+                f"Error reading file {self._file_name}. \n\nError: {e}",
                 MessageBox.b_ok(),
             )
-
             return None
 
         # prepare variables to be visible in the script
         locals_ = dir(self)
         locals_dict = {attr: getattr(self, attr) for attr in locals_ if attr[0] != "_"}
         try:
-            exec(text, locals_dict)
+            exec(code, locals_dict)
         except Exception as e:
             # For development
             # print(e.__traceback__.)
@@ -720,6 +1039,78 @@ class XSectionGenerator:
         self._finalize_view()
         return self._target_view
 
+    def run_headless(
+        self, layout, p1, p2, cell=None, ruler_text=None, layer_cache=None
+    ):
+        """Run the script without the KLayout GUI.
+
+        No views are created and errors are raised instead of being shown
+        in a message box, so this can be used from a standalone python
+        interpreter with the klayout module.
+
+        Parameters
+        ----------
+        layout : Layout or str
+            source layout, or a path to a GDS / OASIS file to be read
+        p1 : DPoint
+            first point of the ruler, in micron
+        p2 : DPoint
+            second point of the ruler, in micron
+        cell : int or str or Cell (optional)
+            index, name or instance of the cell to take the cross-section
+            from. The top cell of the layout is used by default.
+        ruler_text : str (optional)
+            identifier to be used to name a new cross-section cell
+        layer_cache : LayerCache (optional)
+            cache of the layer shapes shared by several runs on the same
+            layout and cell, e.g. LayerCache.for_cuts() or the spatial
+            index returned by layout_index(). If given, layer() clips the
+            shapes from this cache instead of reading them from the layout,
+            and mask() only considers the polygons touching the ruler.
+
+        Returns
+        -------
+        Layout
+            the output layout. Each new target layout requested by the
+            script (see output_all()) is added as a separate cell.
+        """
+        self._headless = True
+        self._layer_cache = layer_cache
+        self._target_view = None
+        self._target_cell_name = f"PYXS: {ruler_text}" if ruler_text else "XSECTION"
+        self._cell_file_name = f"PYXS_{ruler_text}" if ruler_text else "XSECTION"
+
+        if not isinstance(layout, Layout):
+            file_name = os.fspath(layout)
+            layout = Layout()
+            layout.read(file_name)
+
+        if cell is None:
+            cell_index = layout.top_cell().cell_index()
+        elif isinstance(cell, int):
+            cell_index = cell
+        elif isinstance(cell, str):
+            if not layout.has_cell(cell):
+                raise ValueError(f"'run_headless()': no cell named '{cell}'")
+            cell_index = layout.cell(cell).cell_index()
+        else:
+            cell_index = cell.cell_index()
+
+        self._setup_layout(layout, cell_index, p1, p2)
+
+        self._update_basic_regions()
+
+        code = compile_script(self._file_name)
+
+        # prepare variables to be visible in the script
+        locals_ = dir(self)
+        locals_dict = {attr: getattr(self, attr) for attr in locals_ if attr[0] != "_"}
+        exec(code, locals_dict)
+
+        if not self._is_target_layout_created:
+            self._create_new_layout()
+        return self._target_layout
+
     def _finalize_view(self):
         if self._target_view:
             if self._lyp_file:
@@ -787,7 +1178,7 @@ class XSectionGenerator:
         return MaterialData(mask_data, self)
         """
         info("Before MaskData creation")
-        res = MaskData(self._air.data, mask_polygons, self)
+        res = MaskData(self._air._storage, mask_polygons, self)
         info(f"res = {res}")
         return res
 
@@ -844,9 +1235,29 @@ class XSectionGenerator:
             return False
 
         self._cv = cv  # CellView
-        self._layout = cv.layout()  # Layout
+        return self._setup_layout(cv.layout(), cv.cell_index, p1, p2)
+
+    @print_info(False)
+    def _setup_layout(self, layout, cell, p1, p2):
+        """
+        Parameters
+        ----------
+        layout : Layout
+            source layout
+        cell : int
+            index of the source cell
+        p1 : DPoint
+            first point of the ruler
+        p2 : DPoint
+            second point of the ruler
+
+        """
+        self._layout = layout  # Layout
         self._dbu = self._layout.dbu
-        self._cell = cv.cell_index  # int
+        self._cell = cell  # int
+        self._raw_layers = {}
+        self._mask_cache = {}
+        self._union_cache = {}
 
         # get the start and end points in database units and micron
         p1_dbu = Point.from_dpoint(p1 * (1.0 / self._dbu))
@@ -859,6 +1270,10 @@ class XSectionGenerator:
         self._height = int_floor(2.0 / self._dbu + 0.5)  # 2 um in dbu
         self._depth = int_floor(2.0 / self._dbu + 0.5)  # 2 um in dbu
         self._below = int_floor(2.0 / self._dbu + 0.5)  # 2 um in dbu
+        self._round_tolerance = None
+        self._merge_strategy = "fixed"
+        self._surface_engine = False
+        self._region_storage = False
 
         info(f"    XSG._dbu is:    {self._dbu}")
         info(f"    XSG._extend is: {self._extend}")
@@ -875,6 +1290,15 @@ class XSectionGenerator:
         else:
             cell_name = self._target_cell_name
 
+        if self._headless:
+            # collect all target cells in a single layout without a view
+            if not self._is_target_layout_created:
+                self._target_layout = Layout()
+                self._target_layout.dbu = self._dbu
+            self._target_cell = self._target_layout.add_cell(cell_name)
+            self._is_target_layout_created = True
+            return
+
         # create a new layout for the output
         app = Application.instance()
         main_window = app.main_window()
@@ -952,8 +1376,29 @@ class XSectionMRUAction(Action):
 class XSectionScriptEnvironment:
     """The cross section script environment"""
 
-    def __init__(self, menu_name="pyxs"):
+    def __init__(
+        self, menu_name="pyxs", parallel=False, max_workers=None, python_executable=None
+    ):
+        """
+        Parameters
+        ----------
+        menu_name : str
+            name of the submenu in the Tools menu
+        parallel : bool
+            if True, the cross-sections of all rulers are computed
+            concurrently in worker processes. See run_script().
+        max_workers : int
+            number of worker processes. All cores are used by default.
+        python_executable : str
+            python interpreter with the klayout module installed, used to
+            run the worker processes. By default, the interpreter running
+            KLayout is used if it is a python executable, and python3 from
+            PATH otherwise. It must be able to import klayout.db.
+        """
         self._menu_name = menu_name
+        self._parallel = parallel
+        self._max_workers = max_workers
+        self._python_executable = python_executable
 
         app = Application.instance()
         mw = app.main_window()
@@ -1057,16 +1502,24 @@ class XSectionScriptEnvironment:
             except:
                 pass
 
-    def run_script(self, filename, p1=None, p2=None):
+    def run_script(self, filename, p1=None, p2=None, parallel=None):
         """Run .pyxs script
 
         filename : str
             path to the .pyxs script
+        parallel : bool (optional)
+            if True, the cross-sections of all rulers are computed
+            concurrently in worker processes and the resulting layouts
+            are loaded into new views afterwards. Defaults to the value
+            given to the constructor.
         """
         view = Application.instance().main_window().current_view()
         if not view:
             raise UserWarning("No view open for running the pyxs script")
 
+        if parallel is None:
+            parallel = self._parallel
+
         if p1 is None or p2 is None:
             app = Application.instance()
             scr_view = app.main_window().current_view()  # type: LayoutView
@@ -1091,15 +1544,28 @@ class XSectionScriptEnvironment:
 
             p1_arr, p2_arr, ruler_text_arr = [], [], []
 
-            for ruler in rulers:
+            # the text is usually the length of the ruler, which is not
+            # unique, so the rulers with the same text are numbered
+            texts = [ruler.text().split(".")[0] for ruler in rulers]
+            counts = collections.Counter(texts)
+            seen = collections.Counter()
+            for ruler, text in zip(rulers, texts):
                 p1_arr.append(ruler.p1)
                 p2_arr.append(ruler.p2)
-                ruler_text_arr.append(ruler.text().split(".")[0])
+                seen[text] += 1
+                if counts[text] > 1:
+                    text = f"{text} ({seen[text]})"
+                ruler_text_arr.append(text)
 
         else:
             p1_arr, p2_arr, ruler_text_arr = [p1], [p2], [""]
             scr_view_idx = None
 
+        if parallel and len(p1_arr) > 1:
+            return self._run_script_parallel(
+                filename, view.active_cellview(), p1_arr, p2_arr, ruler_text_arr
+            )
+
         target_views = []
         for p1_, p2_, text_ in zip(p1_arr, p2_arr, ruler_text_arr):
 
@@ -1118,6 +1584,141 @@ class XSectionScriptEnvironment:
         #     MessageBox.critical("Script failed", str(e),
         #                             MessageBox.b_ok())
 
+    def _run_script_parallel(self, filename, cv, p1_arr, p2_arr, ruler_text_arr):
+        """Compute the cross-sections in worker processes.
+
+        The batch entry point (python -m klayout_pyxs) is run on a copy of
+        the source layout by a separate python interpreter, with its own
+        module search path, see _worker_python(). The resulting layouts
+        are loaded into new views afterwards.
+
+        Parameters
+        ----------
+        filename : str
+            path to the .pyxs script
+        cv : CellView
+            source cell view
+        p1_arr, p2_arr : list of DPoint
+            ruler start and end points
+        ruler_text_arr : list of str
+            ruler names
+
+        Returns
+        -------
+        target_views : list of LayoutView
+        """
+        python, env = self._worker_python()
+        if python is None:
+            MessageBox.critical(
+                "Error",
+                "No python interpreter with the klayout module found for the "
+                "worker processes. Please pass python_executable to "
+                "XSectionScriptEnvironment.",
+                MessageBox.b_ok(),
+            )
+            return []
+
+        tmp_dir = tempfile.mkdtemp(prefix="pyxs_")
+        try:
+            # the workers read the current state of the source layout. OASIS
+            # keeps the layer names, e.g. of DXF or CIF layouts
+            layout_file = os.path.join(tmp_dir, "source.oas")
+            cv.layout().write(layout_file)
+
+            cuts_file = os.path.join(tmp_dir, "cuts.json")
+            with open(cuts_file, "w") as file:
+                json.dump(
+                    [
+                        {"p1": [p1_.x, p1_.y], "p2": [p2_.x, p2_.y], "name": text_}
+                        for p1_, p2_, text_ in zip(p1_arr, p2_arr, ruler_text_arr)
+                    ],
+                    file,
+                )
+
+            report_file = os.path.join(tmp_dir, "report.json")
+            args = [python, "-m", "klayout_pyxs", filename, layout_file]
+            args += ["--cuts", cuts_file, "--cell", cv.cell.name]
+            args += ["-o", tmp_dir, "--report", report_file]
+            if self._max_workers:
+                args += ["-j", str(self._max_workers)]
+            proc = subprocess.run(
+                args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+
+            main_window = Application.instance().main_window()
+            target_views = []
+            errors = []
+            if not os.path.exists(report_file):
+                errors.append(proc.stderr.decode(errors="replace"))
+                results = []
+            else:
+                with open(report_file) as file:
+                    results = json.load(file)
+            for result in results:
+                if result["error"] is not None:
+                    errors.append(result["error"])
+                    continue
+
+                target_cv = main_window.create_layout(1)  # type: CellView
+                target_cv.layout().read(result["output_file"])
+                target_view = main_window.current_view()  # type: LayoutView
+                target_view.select_cell(
+                    target_cv.layout().top_cells()[-1].cell_index(), 0
+                )
+                if result["layers_file"]:
+                    target_view.load_layer_props(result["layers_file"])
+                target_view.add_missing_layers()
+                target_view.zoom_fit()
+                target_view.max_hier_levels = 1
+                target_views.append(target_view)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        if errors:
+            MessageBox.critical("Error", "\n\n".join(errors), MessageBox.b_ok())
+        return target_views
+
+    def _worker_python(self):
+        """Return the python interpreter for the worker processes.
+
+        The interpreter runs with its own module search path, extended by
+        the folder of klayout_pyxs only. PYTHONHOME is not passed on, as
+        KLayout may point it to its bundled python.
+
+        Returns
+        -------
+        python : str or None
+            path to the interpreter, None if it cannot import klayout.db
+        env : dict
+            environment of the worker processes
+        """
+        python = self._python_executable
+        if python is None:
+            if os.path.basename(sys.executable).startswith("python"):
+                python = sys.executable
+            else:
+                python = shutil.which("python3") or shutil.which("python")
+
+        env = dict(os.environ)
+        env.pop("PYTHONHOME", None)
+        package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(
+            [package_dir] + [p for p in [env.get("PYTHONPATH")] if p]
+        )
+
+        if python is None:
+            return None, env
+        try:
+            proc = subprocess.run(
+                [python, "-c", "import klayout.db, klayout_pyxs"],
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError:
+            return None, env
+        return (python if proc.returncode == 0 else None), env
+
     def make_mru(self, script):
         """Save list of scripts
 
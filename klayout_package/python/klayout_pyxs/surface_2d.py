@@ -0,0 +1,167 @@
+"""klayout_pyxs.surface_2d.py
+
+Surface profile engine for the 2D cross-sections.
+
+As long as the air of a cross-section has no overhangs and no voids, it
+is fully described by the height of its bottom boundary along the cut,
+the surface profile. A square grow of the surface then is a sliding
+maximum (dilation) of the profile, and it can be computed without any
+Minkowski sum or boolean of the polygon engine. Only rectilinear
+profiles are handled, for which the result is exact.
+
+"""
+import bisect
+import heapq
+
+from klayout_pyxs import Box, Point, Region
+
+
+def air_profile(polygons):
+    """Return the surface profile of the air.
+
+    Parameters
+    ----------
+    polygons : list of Polygon
+        air of the cross-section, in dbu
+
+    Returns
+    -------
+    profile : tuple or None
+        (plateaus, box) where plateaus is a list of (x1, x2, y) horizontal
+        segments of the surface from left to right, and box is the
+        bounding box of the air. None if the air is not a single polygon
+        above a rectilinear surface.
+    """
+    if len(polygons) != 1 or polygons[0].holes() > 0:
+        return None
+    box = polygons[0].bbox()
+
+    # the hull is clockwise: the top edge from left to right, then the
+    # surface from right to left
+    pts = list(polygons[0].each_point_hull())
+    try:
+        k = pts.index(Point(box.left, box.top))
+    except ValueError:
+        return None
+    pts = pts[k:] + pts[:k]
+    if len(pts) < 4 or pts[1] != Point(box.right, box.top):
+        return None
+
+    plateaus = []
+    for p1, p2 in zip(pts[1:], pts[2:]):
+        if p1.x == p2.x:
+            continue
+        if p1.y != p2.y or p2.x > p1.x:
+            return None  # slope or overhang
+        plateaus.append((p2.x, p1.x, p1.y))
+    plateaus.reverse()
+    return plateaus, box
+
+
+def grow_profile(profile, columns, xy, z):
+    """Grow the surface in the columns of a mask.
+
+    This is the square grow of the polygon engine, restricted to the air:
+    each horizontal part of the surface inside a column produces a box of
+    xy to the sides and z up and down. The union of these boxes is
+    bounded by the sliding maximum and minimum of the surface over
+    [x - xy, x + xy], and by the surface itself.
+
+    Parameters
+    ----------
+    profile : tuple
+        surface profile, see air_profile()
+    columns : list of tuple
+        (x1, x2) extent of the mask columns, in dbu
+    xy : int
+        lateral extension, in dbu. Must not be negative.
+    z : int
+        height, in dbu
+
+    Returns
+    -------
+    region : Region
+        the new material, in dbu
+    """
+    plateaus, box = profile
+    ends = [x2 for _, x2, _ in plateaus]
+
+    boxes = []
+    for a, b in columns:
+        # the surface inside the column
+        k1 = bisect.bisect_right(ends, a)
+        k2 = bisect.bisect_left(ends, b) + 1
+        clipped = [(max(x1, a), min(x2, b), y) for x1, x2, y in plateaus[k1:k2]]
+        clipped = [(x1, x2, y) for x1, x2, y in clipped if x1 < x2]
+        if not clipped:
+            continue
+
+        extended = [(x1 - xy, x2 + xy, y) for x1, x2, y in clipped]
+        upper = _envelope([(x1, x2, y + z) for x1, x2, y in extended], max)
+        lower = _envelope([(x1, x2, y - z) for x1, x2, y in extended], min)
+
+        # the surface below the grown material
+        x_min = max(upper[0][0], box.left)
+        x_max = min(upper[-1][1], box.right)
+        k1 = bisect.bisect_right(ends, x_min)
+        k2 = bisect.bisect_left(ends, x_max) + 1
+        surface = plateaus[k1:k2]
+
+        xs = sorted(
+            {x for s in (surface, upper, lower) for p in s for x in p[:2]}
+            | {x_min, x_max}
+        )
+        xs = [x for x in xs if x_min <= x <= x_max]
+
+        ih = iu = il = 0
+        for x1, x2 in zip(xs, xs[1:]):
+            while surface[ih][1] <= x1:
+                ih += 1
+            while upper[iu][1] <= x1:
+                iu += 1
+            while lower[il][1] <= x1:
+                il += 1
+            y1 = max(surface[ih][2], lower[il][2])
+            y2 = min(upper[iu][2], box.top)
+            if y2 > y1:
+                boxes.append(Box(x1, y1, x2, y2))
+
+    region = Region()
+    if boxes:
+        region.insert(boxes)
+    region.merge()
+    return region
+
+
+def _envelope(intervals, fn):
+    """Return the upper (fn=max) or lower (fn=min) envelope of intervals.
+
+    Parameters
+    ----------
+    intervals : list of tuple
+        (x1, x2, y), sorted by x1, covering a contiguous range
+    fn : max or min
+
+    Returns
+    -------
+    envelope : list of tuple
+        (x1, x2, y) sorted by x1, covering the same range
+    """
+    sign = -1 if fn is max else 1
+    xs = sorted({x for x1, x2, _ in intervals for x in (x1, x2)})
+
+    envelope = []
+    heap = []  # (sign * y, x2) of the intervals started so far
+    k = 0
+    for x1, x2 in zip(xs, xs[1:]):
+        while k < len(intervals) and intervals[k][0] <= x1:
+            heapq.heappush(heap, (sign * intervals[k][2], intervals[k][1]))
+            k += 1
+        while heap[0][1] <= x1:
+            heapq.heappop(heap)
+        y = sign * heap[0][0]
+        if envelope and envelope[-1][2] == y:
+            envelope[-1] = (envelope[-1][0], x2, y)
+        else:
+            envelope.append((x1, x2, y))
+    return envelope
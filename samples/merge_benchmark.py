@@ -0,0 +1,71 @@
+"""Benchmark of the merge strategies of round grow and etch.
+
+A round grow of a layer with many lines is computed on cuts of growing
+length, once per merge strategy (see merge_strategy()). The number of
+Minkowski sums to merge grows linearly with the length of the cut.
+
+Usage::
+
+    $ python samples/merge_benchmark.py
+"""
+
+import os
+import tempfile
+import time
+
+from klayout.db import Box, DPoint, Layout, LayerInfo
+
+from klayout_pyxs.pyxs_lib import XSectionGenerator
+from klayout_pyxs.utils import print_info
+
+SCRIPT = """
+merge_strategy("{strategy}")
+l1 = layer("1/0")
+substrate = bulk()
+mask(l1).etch(0.3, 0.1, into=substrate, mode="round")
+ox = deposit(0.1, 0.1, mode="round")
+output("1/0", substrate)
+output("2/0", ox)
+"""
+
+PITCH = 1000  # line pitch, in dbu
+N_LINES = (50, 100, 200, 400)
+STRATEGIES = ("fixed", "tree", "final")
+
+
+def make_layout(n_lines):
+    """Return a layout with n_lines vertical lines on layer 1/0"""
+    layout = Layout()
+    layout.dbu = 0.001
+    top = layout.create_cell("TOP")
+    li = layout.layer(LayerInfo(1, 0))
+    for i in range(n_lines):
+        top.shapes(li).insert(Box(i * PITCH, -5000, i * PITCH + PITCH // 2, 5000))
+    return layout
+
+
+@print_info(False)
+def run(script, layout, length):
+    xs = XSectionGenerator(script)
+    xs.run_headless(layout, DPoint(-1.0, 0.0), DPoint(length, 0.0))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        print("lines  " + "".join(f"{s:>10}" for s in STRATEGIES))
+        for n_lines in N_LINES:
+            layout = make_layout(n_lines)
+            length = n_lines * PITCH * layout.dbu + 1.0
+            timings = []
+            for strategy in STRATEGIES:
+                script = os.path.join(tmp, f"{strategy}.pyxs")
+                with open(script, "w") as file:
+                    file.write(SCRIPT.format(strategy=strategy))
+                t0 = time.perf_counter()
+                run(script, layout, length)
+                timings.append(time.perf_counter() - t0)
+            print(f"{n_lines:5d}  " + "".join(f"{t:9.2f}s" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
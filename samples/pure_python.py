@@ -1,18 +1,19 @@
 """Pure python example, where we don't use the klayout GUI.
 
-FIXME! it does not work yet
+The cross-section is generated with the standalone klayout module and
+written to a GDS file next to this script.
 """
 
 import pathlib
-from klayout_pyxs.pyxs_lib import XSectionGenerator
 
+from klayout.db import DPoint
+
+from klayout_pyxs.pyxs_lib import XSectionGenerator
 
-gdspath = pathlib.Path(__file__).parent.absolute() / "sample.gds"
-xg = XSectionGenerator(file_name=gdspath)
+samples_path = pathlib.Path(__file__).parent.absolute()
+gdspath = samples_path / "sample.gds"
+xs_script = samples_path / "cmos.pyxs"
 
-lpoly = xg.layer("3/0")
-lactive = xg.layer("2/0")
-lfox = lactive.inverted()
-lwn = xg.layer("1/0")
-lcg = xg.layer("4/0")
-m1 = xg.layer("6/0")
+xg = XSectionGenerator(str(xs_script))
+layout = xg.run_headless(gdspath, DPoint(0.0, 0.5), DPoint(20.0, 0.5))
+layout.write(str(samples_path / "sample_xs.gds"))
@@ -0,0 +1,75 @@
+#!/bin/bash -e
+
+export KLAYOUT_HOME=/dev/null
+
+echo "Using KLayout:"
+klayout -v
+echo ""
+
+rm -rf run_dir
+mkdir -p run_dir
+
+failed=""
+
+# leading options are passed to the batch entry point, e.g.
+#   bash run_tests_headless.sh --layer-cache xs_etch1.pyxs
+# With options, each test runs two more cuts (the reversed and a
+# perpendicular one), so that the layer cache and index are shared by
+# several rulers. Only the first cut is compared to the golden file.
+batch_opts=()
+while [[ "$1" == --* ]]; do
+  batch_opts+=("$1")
+  shift
+done
+
+if [ "$1" == "" ]; then
+  all_xs=( *.pyxs )
+  tc_files=${all_xs[@]}
+else
+  tc_files=$*
+fi
+
+for tc_file in $tc_files; do
+
+  tc=$(echo "$tc_file" | sed 's/\.pyxs$//')
+
+  echo "---------------------------------------------------"
+  echo "Running testcase $tc .."
+
+  xs_input=$(grep XS_INPUT $tc.pyxs | sed 's/.*XS_INPUT *= *//')
+  if [ "$xs_input" = "" ]; then
+    xs_input="xs_test.gds"
+  fi
+  xs_cut=$(grep XS_CUT $tc.pyxs | sed 's/.*XS_CUT *= *//')
+  if [ "$xs_cut" = "" ]; then
+    xs_cut="-1,0;1,0"
+  fi
+
+  extra_cuts=()
+  if [ ${#batch_opts[@]} -gt 0 ]; then
+    extra_cuts=( $(echo "$xs_cut" | awk -F'[,;]' '{
+      xm = ($1 + $3) / 2; ym = ($2 + $4) / 2
+      printf "--cut=%s,%s;%s,%s\n", $3, $4, $1, $2
+      printf "--cut=%g,%g;%g,%g\n", xm + $2 - ym, ym - $1 + xm, xm - $2 + ym, ym + $1 - xm
+    }') )
+  fi
+
+  python -m klayout_pyxs $tc.pyxs "$xs_input" --cut="$xs_cut" "${extra_cuts[@]}" \
+    "${batch_opts[@]}" -j 1 -o run_dir/$tc
+  mv run_dir/$tc/*_cut0.gds run_dir/$tc.gds
+  rm -rf run_dir/$tc
+
+  if klayout -b -rd a=au/"$tc".gds -rd b=run_dir/"$tc".gds -rd tol=10 -r run_xor.rb; then
+    echo "No differences found."
+  else
+    failed="$failed $tc"
+  fi
+
+done
+
+echo "---------------------------------------------------"
+if [ "$failed" = "" ]; then
+  echo "All tests successful."
+else
+  echo "*** TESTS FAILED:$failed"
+fi